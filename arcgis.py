@@ -0,0 +1,342 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import hashlib
+import http.client
+import io
+import json
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlencode, urlsplit
+from lazy import lazy_import, ensure_loaded
+import metrics
+import resilience
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+pd = lazy_import('pandas')
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Point this at a local stand-in FeatureServer to exercise the engine offline.
+url_prefix = os.environ.get('ARCGIS_URL_PREFIX', 'https://services5.arcgis.com/O5K6bb5dZVZcTo5M/ArcGIS/rest/services/')
+per_host = int(os.environ.get('ARCGIS_PER_HOST', 6))
+default_page_size = 2000
+batch_size = int(os.environ.get('ARCGIS_BATCH_SIZE', 5000))
+
+DatasetReport = namedtuple('DatasetReport', ['dataset', 'rows', 'pages', 'failed_pages', 'seconds', 'error'])
+
+
+class HostPool:
+    """
+    Keep-alive HTTP(S) connections to a single host. At most ``size``
+    requests are in flight at once; idle connections are reused.
+    """
+    def __init__(self, scheme, netloc, size):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    def _connection(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            return cls(self.netloc, timeout=120)
+
+    def get(self, path):
+        with self.slots:
+            for attempt in range(2):
+                conn = self._connection()
+                try:
+                    conn.request('GET', path, headers={'Connection': 'keep-alive'})
+                    response = conn.getresponse()
+                    body = response.read()
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    # A reused connection may have been closed by the server;
+                    # retry once on a fresh one before giving up.
+                    if attempt == 1:
+                        raise
+                    continue
+                if response.will_close:
+                    conn.close()
+                else:
+                    self.idle.put(conn)
+                if response.status != 200:
+                    raise http.client.HTTPException(f'HTTP {response.status} for {path}')
+                return body
+
+
+_pools = {}
+_pools_guard = threading.Lock()
+
+
+def fetch(url):
+    parts = urlsplit(url)
+    with _pools_guard:
+        pool = _pools.get((parts.scheme, parts.netloc))
+        if pool is None:
+            pool = _pools[(parts.scheme, parts.netloc)] = HostPool(parts.scheme, parts.netloc, per_host)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    circuit = resilience.breaker(parts.netloc)
+    circuit.check()
+    try:
+        with metrics.stage('arcgis_fetch', parts.path) as stage:
+            body = pool.get(path)
+            stage['bytes'] = len(body)
+    except Exception as e:
+        if resilience.is_retryable(e):
+            circuit.failure()
+        raise
+    circuit.success()
+    return body
+
+
+def get_json(url):
+    data = json.loads(fetch(url))
+    if 'error' in data:
+        raise http.client.HTTPException(f"ArcGIS error for {url}: {data['error']}")
+    return data
+
+
+def parse_features(stream, state, size=None):
+    """
+    Decodes the ``features[*].attributes`` of a query response into
+    DataFrame batches of at most ``size`` rows. With ijson (a requirement)
+    the response is decoded incrementally, so only one batch of records is
+    ever held as Python objects; without it the response is parsed in one go.
+    ``state['exceeded']`` is set from the response's exceededTransferLimit.
+    :param stream: A binary file-like response body
+    """
+    size = size or batch_size
+    state['exceeded'] = False
+    if ijson is None:
+        data = json.load(stream)
+        if 'error' in data:
+            raise http.client.HTTPException(f"ArcGIS error: {data['error']}")
+        state['exceeded'] = data.get('exceededTransferLimit', False)
+        features = data.pop('features', [])
+        for start in range(0, len(features), size):
+            yield pd.DataFrame.from_records([f['attributes'] for f in features[start:start + size]])
+        return
+    rows = []
+    row = None
+    prefix_len = len('features.item.attributes.')
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if prefix == 'features.item.attributes':
+            if event == 'start_map':
+                row = {}
+            elif event == 'end_map':
+                rows.append(row)
+                if len(rows) == size:
+                    yield pd.DataFrame.from_records(rows)
+                    rows = []
+        elif row is not None and prefix.startswith('features.item.attributes.') and event not in ('map_key', 'start_map', 'start_array'):
+            row[prefix[prefix_len:]] = value
+        elif prefix == 'exceededTransferLimit':
+            state['exceeded'] = value
+        elif prefix == 'error' and event == 'start_map':
+            raise http.client.HTTPException('ArcGIS error in query response')
+    if rows:
+        yield pd.DataFrame.from_records(rows)
+
+
+def layer_url(dataset, layer=0):
+    return f'{url_prefix}{dataset}/FeatureServer/{layer}'
+
+
+def query_url(dataset, out_fields='*', **params):
+    params = {'where': '1=1', 'outFields': out_fields, 'f': 'json', **params}
+    return f'{layer_url(dataset)}/query?{urlencode(params)}'
+
+
+def layer_info(dataset):
+    return get_json(f'{layer_url(dataset)}?f=json')
+
+
+def count(dataset):
+    return get_json(query_url(dataset, returnCountOnly='true'))['count']
+
+
+numeric_types = ('esriFieldTypeInteger', 'esriFieldTypeSmallInteger', 'esriFieldTypeDouble', 'esriFieldTypeSingle')
+
+
+def fingerprint(dataset):
+    """
+    Cheap description of a layer's current contents: its lastEditDate when
+    the layer tracks edits, its record count, and otherwise a hash of the
+    sums of its numeric fields computed server-side.
+    """
+    info = layer_info(dataset)
+    state = {'count': count(dataset),
+             'lastEditDate': (info.get('editingInfo') or {}).get('lastEditDate')}
+    if state['lastEditDate'] is None:
+        stats = [{'statisticType': 'sum', 'onStatisticField': f['name'], 'outStatisticFieldName': f"sum_{i}"}
+                 for i, f in enumerate(info.get('fields', [])) if f.get('type') in numeric_types]
+        if stats:
+            body = fetch(query_url(dataset, outStatistics=json.dumps(stats)))
+            state['statistics'] = hashlib.sha256(body).hexdigest()
+    return state
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _page(dataset, offset, page_size, order_by, out_fields, expected):
+    params = {'resultOffset': offset, 'resultRecordCount': page_size}
+    if order_by:
+        params['orderByFields'] = order_by
+    # The raw body is buffered so a failed read can be retried as a whole;
+    # only its decoding is incremental.
+    body = resilience.call(fetch, query_url(dataset, out_fields, **params), times=3, name=f'{dataset} page at offset {offset}')
+    batches = list(parse_features(io.BytesIO(body), {}))
+    del body
+    df = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+    # A server capping pages below maxRecordCount returns short pages; the
+    # offsets are fixed in advance, so the missing rows would never be fetched.
+    if len(df) != expected:
+        raise http.client.HTTPException(f'{dataset} page at offset {offset} returned {len(df)} of {expected} rows')
+    return df
+
+
+def download(dataset, file, workers=None, out_fields='*'):
+    """
+    Downloads a layer to ``file`` by fetching its pages in parallel once the
+    total is known from a returnCountOnly query. Pages are written in offset
+    order with at most ``workers`` pages held in memory beyond the one being
+    written. A page with fewer rows than it should hold counts as failed, and
+    ``file`` is only replaced when every one of the ``total`` rows arrived.
+    :returns: A DatasetReport with rows written and any failed page offsets
+    """
+    workers = workers or per_host
+    ensure_loaded(pd)
+    start = time.perf_counter()
+    try:
+        info = layer_info(dataset)
+        page_size = info.get('maxRecordCount') or default_page_size
+        order_by = info.get('objectIdField')
+        total = count(dataset)
+    except Exception as e:
+        logger.error(f'FAILED: {dataset} metadata ({e!r})')
+        return DatasetReport(dataset, 0, 0, [], time.perf_counter() - start, e)
+    offsets = list(range(0, total, page_size))
+    failed = []
+    rows = 0
+    columns = None
+    # Pages go to a .part file that replaces ``file`` once complete, so a
+    # crash never leaves a truncated download under the final name.
+    part = f'{file}.part'
+
+    def submit(pool, offset):
+        return pool.submit(_page, dataset, offset, page_size, order_by, out_fields, min(page_size, total - offset))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='page') as pool:
+        remaining = iter(offsets)
+        pending = deque((o, submit(pool, o)) for o in islice(remaining, workers))
+        while pending:
+            done_offset, future = pending.popleft()
+            next_offset = next(remaining, None)
+            if next_offset is not None:
+                pending.append((next_offset, submit(pool, next_offset)))
+            try:
+                df = future.result()
+            except Exception as e:
+                logger.error(f'FAILED: {dataset} page at offset {done_offset} ({e!r})')
+                failed.append(done_offset)
+                continue
+            if columns is None:
+                columns = list(df.columns)
+            df = df.reindex(columns=columns)
+            df.index = range(rows, rows + len(df))
+            df.to_csv(part, mode='w' if rows == 0 else 'a', header=rows == 0)
+            rows += len(df)
+    error = None
+    if not failed and rows != total:
+        error = http.client.HTTPException(f'{dataset} wrote {rows} of {total} rows')
+    if failed or error is not None:
+        # A download with missing rows is never published under ``file``.
+        if os.path.exists(part):
+            os.remove(part)
+    else:
+        if rows == 0:
+            pd.DataFrame().to_csv(part)
+        os.replace(part, file)
+    report = DatasetReport(dataset, rows, len(offsets), failed, time.perf_counter() - start, error)
+    logger.info(f'DOWNLOADED: {dataset} {rows} of {total} rows in {len(offsets)} pages, '
+                f'{len(failed)} failed, {report.seconds:.1f}s')
+    return report
+
+
+def download_all(datasets, directory, suffix, workers=4, manifest_path=None, link=False, fields=None):
+    """
+    Downloads several layers concurrently. Page requests from all datasets
+    share the per-host connection pools, which cap how hard any one server is
+    hit.
+    With ``manifest_path`` only layers whose fingerprint differs from the
+    last successful download are fetched; unchanged layers are skipped, or
+    hard-linked from their previous file when ``link`` is set.
+    :param suffix: Appended to each dataset name to form the file name
+    :param fields: Optional mapping of dataset to the outFields to request
+    :returns: A DatasetReport per dataset, in the order given
+    """
+    fields = fields or {}
+    ensure_loaded(pd)
+    manifest = load_manifest(manifest_path) if manifest_path else None
+    manifest_guard = threading.Lock()
+
+    def one(dataset):
+        start = time.perf_counter()
+        file = f'{directory}/{dataset}{suffix}.csv'
+        try:
+            if manifest is None:
+                return download(dataset, file, out_fields=fields.get(dataset, '*'))
+            state = fingerprint(dataset)
+            previous = manifest.get(dataset, {})
+            previous_file = f"{directory}/{previous.get('file')}"
+            if previous.get('state') == state and (not link or os.path.exists(previous_file)):
+                if link and previous_file != file:
+                    if os.path.exists(file):
+                        os.remove(file)
+                    os.link(previous_file, file)
+                logger.info(f"UNCHANGED: {dataset} since {previous['file']}")
+                return DatasetReport(dataset, state['count'], 0, [], time.perf_counter() - start, None)
+            report = download(dataset, file, out_fields=fields.get(dataset, '*'))
+            if report.error is None and not report.failed_pages:
+                with manifest_guard:
+                    manifest[dataset] = {'state': state, 'file': os.path.basename(file)}
+            return report
+        except Exception as e:
+            logger.exception(f'FAILED: {dataset}')
+            return DatasetReport(dataset, 0, 0, [], time.perf_counter() - start, e)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dataset') as pool:
+        reports = list(pool.map(one, datasets))
+    if manifest is not None:
+        save_manifest(manifest, manifest_path)
+    return reports
@@ -0,0 +1,134 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+import registry
+import snapshots
+import store
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# A table that can be rebuilt from an archived ArcGIS layer: the layer, the
+# rows of it that hold the table (``where``, column equals value) and the
+# registry declaration the daily scrape uses, with its column map pointed at
+# the layer's fields so every day goes through the same transform.
+Target = namedtuple('Target', ['layer', 'declaration', 'where'], defaults=[None])
+
+targets = {
+    'vaccines': Target(
+        'Louisiana_COVID_Vaccination_by_Parish',
+        registry.declarations['vaccines']._replace(
+            columns={'Parish': 'Geography', 'SeriesComp': 'Series Completed', 'SeriesInt': 'Series Initiated'}),
+    ),
+    'case_demo': Target(
+        'Louisiana_COVID_Reporting',
+        registry.declarations['case_demos']._replace(columns={'Group_': 'Category', 'Value': 'value'}),
+        {'Measure': 'Age', 'ValueType': 'case', 'Geography': 'Louisiana'},
+    ),
+}
+
+
+def date_label(date):
+    """
+    '2021-09-10' -> '9/10/2021', the column label the daily scrape uses.
+    """
+    d = datetime.strptime(date, '%Y-%m-%d')
+    return f'{d.month}/{d.day}/{d.year}'
+
+
+def available_dates(layer, start=None, end=None, directory=None, root=None):
+    """
+    Dates with a snapshot of ``layer``, either in the snapshot store or as a
+    daily CSV still in data/full_datasets, between ``start`` and ``end``.
+    """
+    directory = directory or snapshots.full_datasets_path
+    found = set(snapshots.dates(layer, root))
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            m = snapshots.file_pattern.match(name)
+            if m and m.group('dataset') == layer:
+                found.add(m.group('date'))
+    return sorted(d for d in found if (start is None or d >= start) and (end is None or d <= end))
+
+
+def read_layer(layer, date, directory=None, root=None):
+    file = f'{directory or snapshots.full_datasets_path}/{layer}{date}.csv'
+    if os.path.exists(file):
+        return pd.read_csv(file, index_col=0)
+    return snapshots.read(layer, date, root)
+
+
+def day(name, date, directory=None, root=None):
+    """
+    One day of a target table, built in a worker process.
+    :returns: The key columns and one value column labelled as the daily
+        scrape would have labelled it, indexed by the keys
+    """
+    target = targets[name]
+    df = read_layer(target.layer, date, directory, root)
+    for column, value in (target.where or {}).items():
+        df = df[df[column] == value]
+    label = date_label(date)
+    [(_, frame)] = registry.transform(target.declaration, df, label)
+    return frame.set_index(target.declaration.keys)
+
+
+def backfill(name, start=None, end=None, workers=None, path=None, directory=None, root=None, export=False,
+             overwrite=False):
+    """
+    Rebuilds the history of a target table from archived snapshots. Days are
+    transformed in parallel across processes and written to the time-series
+    store in a single transaction. Rows of the table the snapshots do not
+    cover are left as they are.
+    :param export: Also write the table's wide CSV from the store
+    :param overwrite: Replace values already stored for the covered rows;
+        by default only missing values are filled, since a snapshot taken at
+        another time of day can differ from what was scraped
+    :returns: The dates written
+    """
+    target = targets[name]
+    dataset, keys = target.declaration.dataset, target.declaration.keys
+    dates = available_dates(target.layer, start, end, directory, root)
+    if not dates:
+        logger.warning(f'No snapshots of {target.layer} between {start} and {end}.')
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(day, [name] * len(dates), dates, [directory] * len(dates), [root] * len(dates)))
+    # copy() consolidates the per-day blocks before the keys are reinserted.
+    wide = pd.concat(frames, axis=1).copy().reset_index()
+    labels = [date_label(d) for d in dates]
+    file = f'{module_path}/data/{dataset}.csv'
+    store.ensure(dataset, file, keys, path)
+    store.append_days(dataset, wide, keys, labels, path, 'series' if overwrite else 'missing')
+    logger.info(f'Backfilled {dataset} from {target.layer}: {len(wide)} rows, {dates[0]} to {dates[-1]}.')
+    if export:
+        store.export(dataset, file, path)
+    return dates
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Rebuild a table from archived ArcGIS snapshots.')
+    p.add_argument('target', choices=sorted(targets))
+    p.add_argument('--start', help='First date, YYYY-MM-DD')
+    p.add_argument('--end', help='Last date, YYYY-MM-DD')
+    p.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    p.add_argument('--overwrite', action='store_true', help='Replace values already stored for these days')
+    p.add_argument('--export', action='store_true', help='Also write the table\'s wide CSV')
+    args = p.parse_args(argv)
+    backfill(args.target, args.start, args.end, args.workers, export=args.export, overwrite=args.overwrite)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,201 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import argparse
+import glob
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import fixtures
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+results_file = f'{module_path}/benchmarks.jsonl'
+
+
+@contextmanager
+def sandbox():
+    """
+    Points covid_la and the time-series store at a scratch copy of data/ so
+    benchmark runs never touch the real files.
+    """
+    import covid_la
+    import store
+    import workbooks
+    saved = covid_la.module_path, store.store_path
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(f'{tmp}/data')
+        for file in glob.glob(f'{module_path}/data/*.csv'):
+            shutil.copy(file, f'{tmp}/data/')
+        covid_la.module_path = tmp
+        store.store_path = f'{tmp}/data/timeseries.sqlite'
+        workbooks.invalidate()
+        try:
+            yield tmp
+        finally:
+            covid_la.module_path, store.store_path = saved
+            workbooks.invalidate()
+
+
+def record_sources(cassette='sources', names=None):
+    """
+    Runs the sources once against the live dashboards, capturing every
+    response into fixtures/<cassette> for later replay.
+    """
+    import covid_la
+    with sandbox(), fixtures.record(cassette):
+        for name in names or covid_la.all_sources:
+            covid_la.all_sources[name]()
+
+
+def bench_sources(cassette='sources', latency=0.05, names=None):
+    """
+    Times each source end to end against recorded responses, separating the
+    time spent waiting on the replayed network from parse, transform and
+    write time.
+    """
+    import covid_la
+    import workbooks
+    results = []
+    with sandbox():
+        for name in names or covid_la.all_sources:
+            workbooks.invalidate()
+            timer = fixtures.NetworkTimer()
+            with fixtures.replay(cassette, latency, timer):
+                start = time.perf_counter()
+                covid_la.all_sources[name]()
+                seconds = time.perf_counter() - start
+            results.append({'benchmark': 'source', 'name': name, 'seconds': seconds,
+                            'network_seconds': timer.seconds, 'requests': timer.calls,
+                            'latency': latency})
+    return results
+
+
+def bench_pagination(rows=50000, page_size=2000, latency=0.02):
+    """
+    Downloads a synthetic multi-page layer from the stand-in FeatureServer
+    with both the sequential paginator and the concurrent engine.
+    """
+    import arcgis
+    import download_data
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, fixtures.stand_in(rows=rows, page_size=page_size, latency=latency):
+        for name, func in [('download_data.download', lambda: download_data.download('Synthetic', f'{tmp}/a.csv')),
+                           ('arcgis.download', lambda: arcgis.download('Synthetic', f'{tmp}/b.csv'))]:
+            start = time.perf_counter()
+            func()
+            results.append({'benchmark': 'pagination', 'name': name, 'seconds': time.perf_counter() - start,
+                            'rows': rows, 'page_size': page_size, 'latency': latency})
+    return results
+
+
+def bench_merge(rows=70, days=1100):
+    """
+    Adds one day to a synthetic wide table of ``days`` date columns: the old
+    read_csv + outer merge + to_csv path against a store append, and the
+    CSV export the store does on request.
+    """
+    import store
+    dates = pd.date_range('2020-03-09', periods=days + 1)
+    labels = [f'{d.month}/{d.day}/{d.year}' for d in dates]
+    wide = pd.DataFrame(np.random.randint(0, 100000, size=(rows, days)), columns=labels[:days])
+    wide.insert(0, 'County', [f'Parish {i}' for i in range(rows)])
+    today = pd.DataFrame({'County': wide['County'], labels[-1]: np.random.randint(0, 100000, size=rows)})
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        file = f'{tmp}/cases.csv'
+        wide.to_csv(file, index=False)
+
+        start = time.perf_counter()
+        df = pd.read_csv(file)
+        df.merge(today, on='County', how='outer').to_csv(file, index=False)
+        results.append({'benchmark': 'merge', 'name': 'csv merge', 'seconds': time.perf_counter() - start,
+                        'rows': rows, 'days': days})
+
+        path = f'{tmp}/timeseries.sqlite'
+        wide.to_csv(file, index=False)
+        store.import_wide('cases', file, 'County', path)
+        start = time.perf_counter()
+        store.append('cases', today, 'County', labels[-1], path)
+        results.append({'benchmark': 'merge', 'name': 'store append', 'seconds': time.perf_counter() - start,
+                        'rows': rows, 'days': days})
+
+        start = time.perf_counter()
+        store.wide('cases', path).to_csv(file, index=False)
+        results.append({'benchmark': 'merge', 'name': 'store export', 'seconds': time.perf_counter() - start,
+                        'rows': rows, 'days': days})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=module_path,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results():
+    latest = {}
+    if os.path.exists(results_file):
+        with open(results_file) as f:
+            for line in f:
+                r = json.loads(line)
+                latest[(r['benchmark'], r['name'])] = r
+    return latest
+
+
+def save(results):
+    """
+    Appends results to benchmarks.jsonl with the run time and commit and
+    prints each one next to the last recorded result of the same benchmark.
+    """
+    previous = previous_results()
+    stamp = {'run': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit()}
+    with open(results_file, 'a') as f:
+        for r in results:
+            f.write(json.dumps({**stamp, **r}) + '\n')
+            last = previous.get((r['benchmark'], r['name']))
+            change = f" ({r['seconds'] / last['seconds'] - 1:+.0%} vs {last['commit']})" if last and last['seconds'] else ''
+            print(f"{r['benchmark']:<11} {r['name']:<28} {r['seconds']:8.3f}s{change}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Benchmarks for the covid_la pipeline.')
+    p.add_argument('suites', nargs='*', default=['merge', 'pagination', 'sources'],
+                   help='merge, pagination, sources, or record to capture source fixtures')
+    p.add_argument('--cassette', default='sources')
+    p.add_argument('--latency', type=float, default=0.05, help='Seconds added to each replayed request')
+    args = p.parse_args(argv)
+    if 'record' in args.suites:
+        record_sources(args.cassette)
+        return
+    results = []
+    if 'merge' in args.suites:
+        results += bench_merge()
+    if 'pagination' in args.suites:
+        results += bench_pagination(latency=args.latency)
+    if 'sources' in args.suites:
+        if os.path.exists(f'{fixtures.fixtures_path}/{args.cassette}/index.json'):
+            results += bench_sources(args.cassette, args.latency)
+        else:
+            logger.warning(f'No fixtures recorded in fixtures/{args.cassette}; run "benchmark.py record" first.')
+    save(results)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,128 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import argparse
+import logging
+from datetime import datetime
+
+
+def names(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def scrape(args):
+    import covid_la
+    unknown = set(args.only or []) | set(args.skip or [])
+    unknown -= set(covid_la.all_sources)
+    if unknown:
+        sys.exit(f"Unknown sources: {', '.join(sorted(unknown))}. Choose from: {', '.join(covid_la.all_sources)}")
+    covid_la.main(export=args.export, max_workers=args.workers, only=args.only, skip=args.skip, date=args.date,
+                  check=args.preflight)
+
+
+def list_sources(args):
+    import covid_la
+    for name in covid_la.all_sources:
+        print(name + ('' if covid_la.all_sources[name] in covid_la.sources else ' (not in the daily run)'))
+
+
+def download(args):
+    import download_data
+    import metrics
+    metrics.start_run()
+    try:
+        download_data.download_all(workers=args.workers, incremental=not args.full, link=args.link, keep_csv=args.keep_csv)
+    finally:
+        metrics.write_report('download')
+
+
+def export(args):
+    import covid_la
+    import staging
+    with staging.batch():
+        covid_la.export_csv(args.datasets or None)
+        if not args.datasets:
+            covid_la.derived.build_all()
+
+
+def backfill(args):
+    import backfill
+    if args.target not in backfill.targets:
+        sys.exit(f"Unknown target {args.target}. Choose from: {', '.join(backfill.targets)}")
+    backfill.backfill(args.target, args.start, args.end, args.workers, export=args.export,
+                      overwrite=args.overwrite)
+
+
+def serve(args):
+    import query
+    query.serve(args.host, args.port)
+
+
+def parser():
+    p = argparse.ArgumentParser(prog='cli.py', description='Louisiana COVID-19 data pipeline.')
+    p.add_argument('--profile', metavar='FILE', help='Run under cProfile and write the stats to FILE')
+    sub = p.add_subparsers(dest='command', required=True)
+
+    s = sub.add_parser('scrape', help='Run the LDH Tableau sources')
+    s.add_argument('--only', type=names, help='Comma-separated sources to run instead of the daily set')
+    s.add_argument('--skip', type=names, help='Comma-separated sources to leave out')
+    s.add_argument('--date', type=date, help='Store the data under this YYYY-MM-DD date instead of today')
+    s.add_argument('--workers', type=int, help='Maximum sources running at once')
+    s.add_argument('--export', action='store_true', help='Also write the wide CSVs and forweb tables')
+    s.add_argument('--preflight', choices=['skip', 'abort', 'off'], default='skip',
+                   help='When a dashboard no longer has what a source reads: skip that source (default), '
+                        'abort the run, or do not check')
+    s.set_defaults(func=scrape)
+
+    s = sub.add_parser('sources', help='List the available sources')
+    s.set_defaults(func=list_sources)
+
+    s = sub.add_parser('download', help='Download the LDH ArcGIS datasets')
+    s.add_argument('--workers', type=int, default=4, help='Datasets downloading at once')
+    s.add_argument('--full', action='store_true', help='Download every dataset even if unchanged')
+    s.add_argument('--link', action='store_true', help='Hard-link unchanged datasets to their last file')
+    s.add_argument('--keep-csv', action='store_true', help='Keep the daily CSVs after archiving them')
+    s.set_defaults(func=download)
+
+    s = sub.add_parser('export', help='Write wide CSVs from the time-series store')
+    s.add_argument('datasets', nargs='*', help='Datasets to export (default: all, plus forweb tables)')
+    s.set_defaults(func=export)
+
+    s = sub.add_parser('backfill', help='Rebuild a table\'s history from archived ArcGIS snapshots')
+    s.add_argument('target', help='vaccines or case_demo')
+    s.add_argument('--start', help='First date, YYYY-MM-DD')
+    s.add_argument('--end', help='Last date, YYYY-MM-DD')
+    s.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    s.add_argument('--overwrite', action='store_true', help='Replace values already stored for these days')
+    s.add_argument('--export', action='store_true', help='Also write the table\'s wide CSV')
+    s.set_defaults(func=backfill)
+
+    s = sub.add_parser('serve', help='Serve the time-series store over HTTP')
+    s.add_argument('--host', default='127.0.0.1')
+    s.add_argument('--port', type=int, default=8000)
+    s.set_defaults(func=serve)
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    import download_data
+    download_data.setup_logging(logging.getLogger())
+    if args.profile:
+        import metrics
+        with metrics.profile(args.profile):
+            args.func(args)
+    else:
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
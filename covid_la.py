@@ -8,9 +8,22 @@ if module_path not in sys.path:
 from urllib.request import urlopen
 import json
 from datetime import datetime, timedelta
-import pandas as pd
-from tableauscraper import TableauScraper as TS
-import time
+import threading
+from lazy import lazy_import, ensure_loaded
+import metrics
+import resilience
+import scheduler
+import staging
+
+# Deferred until a source runs, so the CLI and partial runs start quickly.
+pd = lazy_import('pandas')
+tableauscraper = lazy_import('tableauscraper')
+store = lazy_import('store')
+revisions = lazy_import('revisions')
+derived = lazy_import('derived')
+registry = lazy_import('registry')
+preflight = lazy_import('preflight')
+workbooks = lazy_import('workbooks')
 
 import logging
 
@@ -27,177 +40,197 @@ log_date_fmt = "%Y-%m-%d %H:%M:%S"
 #with open(f'{module_path}/static_data.json') as f:
 #    static_data = json.load(f)
 
-update_date = datetime.now()
-#update_date = pd.to_datetime('2022-11-30')
+def set_update_date(date=None):
+    """
+    Sets the date today's column is stored under. Defaults to now; pass a
+    date to re-run or backfill a specific day.
+    """
+    global update_date, update_date_string
+    update_date = date or datetime.now()
+    if os.name == 'nt':
+        update_date_string = update_date.strftime('%#m/%#d/%#Y')
+    else:
+        update_date_string = update_date.strftime('%-m/%-d/%Y')
 
-if os.name == 'nt':
-    update_date_string = update_date.strftime('%#m/%#d/%#Y')
-else:
-    update_date_string = update_date.strftime('%-m/%-d/%Y')
+set_update_date()
 
 def retry(times):
     """
     Retry Decorator
-    Retries the wrapped function/method `times` times if the exceptions listed
-    in ``exceptions`` are thrown
-    :param times: The number of times to repeat the wrapped function/method
+    Retries a source up to `times` attempts on network failures, backing off
+    between attempts and failing fast while analytics.la.gov is down. Cached
+    Tableau sessions used by a failed attempt are dropped.
+    :param times: The number of attempts
     :type times: Int
     """
-    def decorator(func):
-        def newfn(*args, **kwargs):
-            attempt = 0
-            while attempt < times:
-                try:
-                    return func(*args, **kwargs)
-                except:
-                    logger.error(
-                        'Exception thrown when attempting to run %s, attempt '
-                        '%d of %d' % (func, attempt, times)
-                    )
-                    attempt += 1
-                    time.sleep(5)
-            return func(*args, **kwargs)
-        return newfn
-    return decorator
-
-def csv_loader(file, date):
-    df = pd.read_csv(file, dtype={'FIPS': object})
-    if date in df.columns:
-        df = df.drop(columns=date)
-    return df
+    # Looked up on failure, not here, so decorating a source does not load
+    # workbooks and tableauscraper.
+    return resilience.retry(times, host='analytics.la.gov', on_failure=lambda: workbooks.invalidate_requested())
 
-@retry(times=5)
-def cases():
-    logger.info('STARTING: Parish case data by type.')
-    # load data from tableau workbook
-    url='https://analytics.la.gov/t/LDH/views/CasesChartsforDashboard/NewandPreviousCasesbyDate'
-    ts = TS()
-    ts.loads(url)
-    workbook = ts.getWorkbook()
-    # tabular data on total cases is in the Table: New and Previous Cases chart 
-    # in the Cases by Test Date tab of Covid-19 Cases by Test Collection Date
-    workbook = workbook.setParameter("New and Previous Cases Chart Selection", "Table: Cases by Type by Parish")
-    cases = pd.DataFrame(workbook.getWorksheet('Parish Cases List (2)').data)
-    cases = cases.rename(columns={'parish-value' : 'County', 'SUM(Cases)-alias' : update_date_string})
-    case_types = {'%all%' : 'cases_total', 
-                    'Confirmed' : 'cases', 
-                    'Probable' : 'cases_probable', 
-                    'Reinfections' : 'cases_reinfections'}
-    print(cases.columns)
-    for category in case_types.keys():
-        df = cases[(cases['casetype-value'] == category) & (cases['County']!='%all%')][['County', update_date_string]]
-        # Summing all parish data because on launch West Feliciana had multiple rows
-        df = df.groupby('County').agg({update_date_string : 'sum'}).reset_index()
-        df_file = csv_loader(f"{module_path}/data/{case_types[category]}.csv", update_date_string)
-        df_file.merge(df, on='County', how='outer').to_csv(f"{module_path}/data/{case_types[category]}.csv", index=False)
-    logger.info('COMPLETE: Parish case data by type downloaded and stored.')
+# Tables kept in the long-format time-series store and the key columns each
+# day's data is matched on. The wide CSVs in data/ are exported from the store.
+stored_datasets = {
+    'cases' : 'County',
+    'cases_total' : 'County',
+    'cases_probable' : 'County',
+    'cases_reinfections' : 'County',
+    'deaths' : 'County',
+    'deaths_total' : 'County',
+    'deaths_probable' : 'County',
+    'case_demo' : ['Geography', 'Category'],
+    'capacity' : ['LDH Region', 'Category'],
+    'vaccines' : ['Geography', 'Category'],
+    'vaccines_demo' : ['Geography', 'Category'],
+}
 
-@retry(times=5)
-def deaths():
-    logger.info('STARTING: Parish death data by type.')
-    # load data from tableau workbook
-    url='https://analytics.la.gov/t/LDH/views/URLDashboardDeaths/DeathsbyParishList'
-    ts = TS()
-    ts.loads(url)
-    workbook = ts.getWorkbook()
-    deaths = pd.DataFrame(workbook.getWorksheet('Deaths by Parish and Region').data)
-    deaths = deaths.rename(columns = {'Parish-value' : 'County', 'SUM(Value)-alias' : update_date_string})
-    print(deaths.columns)
-    death_types = {'Total Deaths' : 'deaths_total',
-                    'Probable Deaths' : 'deaths_probable',
-                    'Confirmed Deaths' : 'deaths'}
-    for category in death_types.keys():
-        df = deaths[(deaths['Measure-value'] == category) & (deaths['County']!='%all%')][['County', update_date_string]]
-        df_file = csv_loader(f"{module_path}/data/{death_types[category]}.csv", update_date_string)
-        df_file.merge(df, on='County', how='outer').to_csv(f"{module_path}/data/{death_types[category]}.csv", index=False)
-    logger.info('COMPLETE: Parish death data by type downloaded and stored.')
-
-def case_demos():
-    logger.info('STARTING: Case demographics')
-    ts = TS()
-    url = 'https://analytics.la.gov/t/LDH/views/CasesChartsforDashboard/CasesbyAge'
-    ts.loads(url)
-    workbook = ts.getWorkbook()
-    workbook = workbook.setParameter("Select Age Range View", "Cumulative Cases Bar Chart")
-    ages = pd.DataFrame(workbook.getWorksheet('Cases by Age Cumulative').data)
-    age_converter = {
-        '0-4'   : '0 to 4',
-        '5-17'  : '5 to 17',
-        '18-29' : '18 to 29',
-        '30-39' : '30 to 39',
-        '40-49' : '40 to 49',
-        '50-59' : '50 to 59',
-        '60-69' : '60 to 69',
-        '+70'   : '70+'             
-                    }
-    ages['Date'] = update_date_string
-    print(ages.columns)
-    ages = ages.rename(columns = {
-        'Age Range-value' : 'Category',
-        'region-alias' : 'Geography',
-        'SUM(Cases)-value' : 'Cases'
-    })
-    ages['Category'] = ages['Category'].replace(age_converter)
-    age_export = pd.pivot(ages, index=['Category', 'Geography'], columns='Date', values='Cases').reset_index()
-    age_export['Geography'] = age_export['Geography'].apply(lambda x: f"Region {x.split(' - ')[0]}")
-    age_export_la = age_export.groupby('Category').sum().reset_index()
-    age_export_la['Geography'] = 'Louisiana'
-    age_export_la = age_export_la.rename(columns={'Date' : update_date_string})
-    logger.info('COMPLETE: Case demographics downloaded and saved.')
-    df_file = csv_loader(f"{module_path}/data/case_demo.csv", update_date_string)
-    df_file.merge(age_export_la, on=['Geography', 'Category'], how='outer').to_csv(f"{module_path}/data/case_demo.csv", index=False)
+# Datasets appended to during this run; only these are exported.
+written_datasets = set()
+
+def store_day(dataset, df):
+    """
+    Appends today's column for ``dataset`` to the time-series store, seeding
+    the store from the existing wide CSV the first time the dataset is seen.
+    """
+    on = stored_datasets[dataset]
+    with metrics.stage('store_append', dataset) as stage:
+        metrics.frame_size(stage, df)
+        store.ensure(dataset, f"{module_path}/data/{dataset}.csv", on)
+        store.append(dataset, df, on, update_date_string)
+    written_datasets.add(dataset)
+
+_worker_sessions = threading.local()
+
+def worker_worksheet(url, worksheet):
+    """
+    Returns ``worksheet`` from a scraper session owned by the calling thread,
+    so parallel filter sweeps never share server-side filter state.
+    """
+    sheets = _worker_sessions.__dict__.setdefault('sheets', {})
+    if (url, worksheet) not in sheets:
+        ts = tableauscraper.TableauScraper(logLevel='ERROR')
+        with metrics.stage('tableau_load', url):
+            ts.loads(url)
+        sheets[(url, worksheet)] = ts.getWorksheet(worksheet)
+    return sheets[(url, worksheet)]
+
+def drop_worker_worksheet(url, worksheet):
+    _worker_sessions.__dict__.get('sheets', {}).pop((url, worksheet), None)
+
+def filter_values(worksheet, column):
+    """
+    The values of the worksheet filter on ``column``, looked up by name so a
+    reordered filter list cannot silently sweep the wrong filter.
+    """
+    for f in worksheet.getFilters():
+        if f['column'] == column:
+            return f['values']
+    raise KeyError(f'No filter {column!r} on worksheet {worksheet.name!r}')
+
+def export_csv(datasets=None):
+    """
+    Writes the wide one-column-per-day CSVs in data/ from the store. Only
+    called when the CSV view is wanted; the store is the primary copy.
+    """
+    for dataset in stored_datasets.keys() if datasets is None else datasets:
+        if store.exists(dataset):
+            with scheduler.file_lock(f"{module_path}/data/{dataset}.csv"), metrics.stage('csv_write', dataset):
+                store.export(dataset, f"{module_path}/data/{dataset}.csv")
 
+def declared(declaration):
+    """
+    Builds a source function from a registry.Declaration: loads its
+    worksheet, runs the declared transform and stores each resulting
+    dataset, recording stored datasets so a retry resumes after them.
+    """
+    def source():
+        logger.info(f'STARTING: {declaration.description}.')
+        ts = workbooks.scraper(declaration.url)
+        workbook = ts.getWorkbook()
+        if declaration.parameter:
+            workbook = workbook.setParameter(*declaration.parameter)
+        df = pd.DataFrame(workbook.getWorksheet(declaration.worksheet).data)
+        written = resilience.checkpoint(declaration.name)
+        for dataset, frame in registry.transform(declaration, df, update_date_string):
+            if dataset in written:
+                continue
+            store_day(dataset, frame)
+            written[dataset] = True
+        logger.info(f'COMPLETE: {declaration.description} downloaded and stored.')
+    source.__name__ = source.__qualname__ = declaration.name
+    return retry(times=5)(source)
+
+cases = declared(registry.declarations['cases'])
+deaths = declared(registry.declarations['deaths'])
+case_demos = declared(registry.declarations['case_demos'])
+vaccines = declared(registry.declarations['vaccines'])
 
 @retry(times=5)
 def hospitalizations():
     logger.info('STARTING: State hospitalization and ventilator data.')
     url = 'https://analytics.la.gov/t/LDH/views/URLDashboardHospitalizations/HospitalCharts'
-    ts = TS()
-    ts.loads(url)
+    ts = workbooks.scraper(url)
     workbook = ts.getWorkbook()
     hosp_worksheet = workbook.getWorksheet('Hospital and Vent Usage')
-    hosp = hosp_worksheet.data
+    hosp = hosp_worksheet.data.copy()
     hosp['DateTime-value'] = pd.to_datetime(hosp['DateTime-value']).dt.strftime('%m/%d/%Y')
     hosp = hosp.rename(columns={'DateTime-value' : 'Category', 'SUM(Covid Positive in Hospital)-value' : 'hospitalized', 'SUM(Covid Positive on Vent)-alias' : 'on_vent'})
     hosp = hosp[['Category', 'hospitalized', 'on_vent']].set_index('Category').transpose().reset_index().rename(columns={'index' : 'Category'})
-    hosp.to_csv(f'{module_path}/data/hospitalizations.csv', index=False)
+    with scheduler.file_lock(f'{module_path}/data/hospitalizations.csv'), metrics.stage('csv_write', 'hospitalizations') as stage:
+        metrics.frame_size(stage, hosp)
+        staging.write_csv(hosp, f'{module_path}/data/hospitalizations.csv', index=False)
+    revisions.record('hospitalizations', hosp, update_date_string)
     logger.info('COMPLETE: State hospitalization data downloaded and stored.')
 
 @retry(times=5)
 def hosp_region():
     logger.info('STARTING: Regional hospitalization and ventilator data.')
     url = 'https://analytics.la.gov/t/LDH/views/URLDashboardHospitalizations/HospitalCharts'
-    ts = TS(logLevel='ERROR')
-    ts.loads(url)
-    workbook = ts.getWorkbook()
-    sheets = workbook.getSheets()
+    ts = workbooks.scraper(url)
     ws = ts.getWorksheet('Hospital and Vent Usage')
-    filters = ws.getFilters()
-    hosp = pd.DataFrame()
-    for t in filters[0]['values']:
-        if t != 'Under Investigation':
-            logger.info(f'    DOWNLOADED: {t} hospitalization and ventilator data')
-            wb = ws.setFilter('Region', t, dashboardFilter=True)
+
+    finished = resilience.checkpoint('hosp_region')
+
+    def region(t):
+        if t in finished:
+            return finished[t]
+        logger.info(f'    DOWNLOADED: {t} hospitalization and ventilator data')
+        try:
+            sheet = worker_worksheet(url, 'Hospital and Vent Usage')
+            with metrics.stage('tableau_filter', 'Region', value=t):
+                wb = sheet.setFilter('Region', t, dashboardFilter=True)
             regionWs = wb.getWorksheet('Hospital and Vent Usage')
-            df = pd.DataFrame(regionWs.data)
-            df = df.rename(columns = {'SUM(Covid Positive in Hospital)-value' : 'hospitalized - '+t, 'SUM(Covid Positive on Vent)-alias' : 'on_vent - '+t, 'DateTime-value' : 'date'})
-            df['date'] = pd.to_datetime(df['date']).dt.strftime('%m/%d/%Y')
-            df = df.set_index('date')
-            hosp = pd.concat([hosp, df[['hospitalized - '+t, 'on_vent - '+t]]], axis = 1)
+            if regionWs.data.empty:
+                raise resilience.EmptyResponse(f'No hospitalization data for Region {t!r}')
+        except Exception:
+            drop_worker_worksheet(url, 'Hospital and Vent Usage')
+            raise
+        df = pd.DataFrame(regionWs.data)
+        df = df.rename(columns = {'SUM(Covid Positive in Hospital)-value' : 'hospitalized - '+t, 'SUM(Covid Positive on Vent)-alias' : 'on_vent - '+t, 'DateTime-value' : 'date'})
+        df['date'] = pd.to_datetime(df['date']).dt.strftime('%m/%d/%Y')
+        df = df.set_index('date')
+        finished[t] = df[['hospitalized - '+t, 'on_vent - '+t]]
+        return finished[t]
+
+    regions = [t for t in filter_values(ws, 'Region') if t != 'Under Investigation']
+    hosp = pd.DataFrame()
+    for df in scheduler.fan_out(region, regions):
+        hosp = pd.concat([hosp, df], axis = 1)
     hosp = hosp.transpose().reset_index()
     h = hosp['index'].str.split(' - ', expand=True).rename(columns={0 : 'Category', 1 : 'Geography'})
     hosp = pd.concat([h[['Geography', 'Category']], hosp], axis=1)
     hosp['Geography'] = 'Region '+hosp['Geography']
     hosp = hosp.drop('index', axis=1)
-    hosp.to_csv(f'{module_path}/data/region_hosp.csv', index=False)
+    with scheduler.file_lock(f'{module_path}/data/region_hosp.csv'), metrics.stage('csv_write', 'region_hosp') as stage:
+        metrics.frame_size(stage, hosp)
+        staging.write_csv(hosp, f'{module_path}/data/region_hosp.csv', index=False)
+    revisions.record('region_hosp', hosp, update_date_string)
     logger.info('COMPLETE: Regional hospitalization and ventilator data downloaded and stored.')
 
 @retry(times=5)
 def capacity():
     logger.info('STARTING: Hospital capacity data.')
-    ts = TS()
     url = 'https://analytics.la.gov/t/LDH/views/URLDashboardHospitalizations/RegBedAvailability'
-    ts.loads(url)
+    ts = workbooks.scraper(url)
     workbook = ts.getWorkbook()
     worksheet = workbook.getWorksheet('Hospital Reg Bed Availability')
     beds = pd.DataFrame(worksheet.data)
@@ -238,12 +271,11 @@ def capacity():
                     on="LDH Region"
                 )
     )
-    beds_all['LDH Region'] = beds_all['LDH Region'].apply(lambda x: f"Region {x.split(' - ')[0]}")
+    beds_all['LDH Region'] = registry.region_labels(beds_all['LDH Region'])
     beds_all = pd.melt(beds_all, id_vars = 'LDH Region', value_vars=['Hospital Beds Still Available', 'Hospital Beds In Use', 'Hospital Beds Total'])
 
-    ts = TS()
     url = 'https://analytics.la.gov/t/LDH/views/URLDashboardHospitalizations/ICUBedAvailability'
-    ts.loads(url)
+    ts = workbooks.scraper(url)
     workbook = ts.getWorkbook()
     worksheet = workbook.getWorksheet('Hospital ICU Bed Availability')
     icu = pd.DataFrame(worksheet.data)
@@ -285,38 +317,15 @@ def capacity():
                     on='LDH Region'
                 )
     )
-    icu_all['LDH Region'] = icu_all['LDH Region'].apply(lambda x: f"Region {x.split(' - ')[0]}")
+    icu_all['LDH Region'] = registry.region_labels(icu_all['LDH Region'])
     icu_all = pd.melt(icu_all, id_vars = 'LDH Region', value_vars=['ICU Still Available', 'ICU In Use', 'ICU Total'])
 
     cap = pd.concat([beds_all, icu_all], axis=0)
     cap = cap.rename(columns = {'variable' : 'Category', 'value' : update_date_string})
-    cap_file = csv_loader(f"{module_path}/data/capacity.csv", update_date_string)
-    cap_file.merge(cap, on=['LDH Region', 'Category'], how='outer').to_csv(f"{module_path}/data/capacity.csv", index=False)
+    store_day('capacity', cap)
 
     logger.info('COMPLETE: Hospital capacity data downloaded and stored.')
 
-@retry(times=5)
-def vaccines():
-    logger.info('STARTING: Parish vaccine data.')
-    ts = TS()
-    url = 'https://analytics.la.gov/t/LDH/views/VaccinationDashboard2/VaccinationStatusbyAgeRaceGender2'
-    ts.loads(url)
-    workbook = ts.getWorkbook()
-    worksheet = workbook.getWorksheet('Cumulative % Totals Demo Tables').data
-    parishes = worksheet.groupby('Parish-value').agg({'ATTR(Completed)-alias' : 'max', 'ATTR(Initiated)-alias' : 'max'})
-    parishes = parishes.reset_index()
-    parishes = parishes.rename(columns = {'ATTR(Completed)-alias' : 'Series Completed', 'ATTR(Initiated)-alias' : 'Series Initiated', 'Parish-value' : 'Geography'})
-    parishes = pd.melt(parishes, id_vars=['Geography'], value_vars=['Series Completed', 'Series Initiated']).rename(columns = {'variable' : 'Category', 'value' : update_date_string})
-    state = parishes.groupby('Category').sum().reset_index()
-    state['Geography'] = 'State'
-    parishes['Category'] = parishes.apply(lambda x: f"Parish - {x['Category']}", axis=1)
-    state['Category'] = state.apply(lambda x: f"Total {x['Category']}", axis=1)
-    vaccines_export = pd.concat([state, parishes], axis=0)
-    vaccines_file = csv_loader(f"{module_path}/data/vaccines.csv", update_date_string)
-    vaccines_file.merge(vaccines_export, on=['Geography', 'Category'], how='outer').to_csv(f"{module_path}/data/vaccines.csv", index=False)
-    logger.info('COMPLETE: Parish vaccine data downloaded and stored.')
-
-
 @retry(times=5)
 def vaccine_demos():
     logger.info('STARTING: Vaccine demographic data.')
@@ -330,23 +339,34 @@ def vaccine_demos():
         '60 - 69' : '60 to 69 Years',
         '70+'     : '70+ Years'
     }
-    ts = TS(logLevel='ERROR')
     url = 'https://analytics.la.gov/t/LDH/views/VaccinationDashboard2/VaccinationStatusbyAgeRaceGender'
     df_export = pd.DataFrame()
-    ts.loads(url)
-    workbook = ts.getWorkbook()
+    ts = workbooks.scraper(url)
     worksheet = ts.getWorksheet('Cumulative Totals by Demographics')
-    print(worksheet.getFilters())
-    for geography in worksheet.getFilters()[2]['values']:
+
+    finished = resilience.checkpoint('vaccine_demos')
+
+    def geography_demos(geography):
+        if geography in finished:
+            return finished[geography]
         logger.info(f"    DOWNLOADING: {geography} vaccine demographics")
-        area = worksheet.setFilter('area', geography)
-        area = area.getWorksheet('Cumulative Totals by Demographics')
-        df_temp = pd.DataFrame()
-        for measure in ['Race', 'Gender', 'Age']:
-            logger.info(f"        DOWNLOADING: {geography} {measure} data")
-            category = area.setFilter('Measure Group', measure)
-            category = category.getWorksheet('Cumulative Totals by Demographics')
-            df_temp = pd.concat([df_temp, category.data], axis=0)
+        try:
+            area = worker_worksheet(url, 'Cumulative Totals by Demographics')
+            with metrics.stage('tableau_filter', 'area', value=geography):
+                area = area.setFilter('area', geography)
+            area = area.getWorksheet('Cumulative Totals by Demographics')
+            df_temp = pd.DataFrame()
+            for measure in ['Race', 'Gender', 'Age']:
+                logger.info(f"        DOWNLOADING: {geography} {measure} data")
+                with metrics.stage('tableau_filter', 'Measure Group', value=measure):
+                    category = area.setFilter('Measure Group', measure)
+                category = category.getWorksheet('Cumulative Totals by Demographics')
+                if category.data.empty:
+                    raise resilience.EmptyResponse(f'No {measure} vaccine data for {geography!r}')
+                df_temp = pd.concat([df_temp, category.data], axis=0)
+        except Exception:
+            drop_worker_worksheet(url, 'Cumulative Totals by Demographics')
+            raise
         df_temp['Vaccination Status-value'] = df_temp['Vaccination Status-value'].replace({'Complete' : 'Series Complete'})
         df_temp['Vaccination Status-value'] = df_temp['Vaccination Status-value'].replace({'Incomplete' : 'Series Initiated'})
         df_temp['Measure Group-alias'] = df_temp['Measure Group-alias'].str.replace('Gender', 'Sex')
@@ -354,26 +374,80 @@ def vaccine_demos():
         df_temp['Measure-value'] = df_temp['Measure-value'].replace({'Unknown Gender' : 'Gender Unknown'})
         df_temp['SUM(Value)-alias'] = pd.to_numeric(df_temp['SUM(Value)-alias'], errors='coerce')
         df_total = df_temp.groupby(['Measure Group-alias', 'Measure-value']).agg({'SUM(Value)-alias' : 'sum'}).reset_index()
-        df_total['Category'] = df_total.apply(lambda x: f"{x['Measure Group-alias']} - Total Population : {x['Measure-value']}", axis=1)
-        df_temp['Category'] = df_temp.apply(lambda x: f"{x['Measure Group-alias']} - {x['Vaccination Status-value']} : {x['Measure-value']}", axis=1)
+        df_total['Category'] = registry.category('{Measure Group-alias} - Total Population : {Measure-value}', df_total)
+        df_temp['Category'] = registry.category('{Measure Group-alias} - {Vaccination Status-value} : {Measure-value}', df_temp)
         df_temp = pd.concat([df_temp, df_total], axis=0)
         df_temp['Geography'] = geography.replace('_','')
         df_temp = df_temp.rename(columns={'SUM(Value)-alias' : update_date_string})
-        df_export = pd.concat([df_export, df_temp[['Geography', 'Category', update_date_string]]])
+        finished[geography] = df_temp[['Geography', 'Category', update_date_string]]
+        return finished[geography]
+
+    for df_temp in scheduler.fan_out(geography_demos, filter_values(worksheet, 'area')):
+        df_export = pd.concat([df_export, df_temp])
     df_export = df_export[['Geography', 'Category', update_date_string]]
-    vaccine_demo_file = csv_loader(f'{module_path}/data/vaccines_demo.csv', update_date_string)
-    vaccine_demo_file.merge(df_export, on=['Geography', 'Category'], how='outer').to_csv(f"{module_path}/data/vaccines_demo.csv", index=False)
+    store_day('vaccines_demo', df_export)
     logger.info("COMPLETE: Vaccine demographic data downloaded and stored")
     
-def main():
-    cases()
-    case_demos()
-    deaths()
-    hospitalizations()
-    hosp_region()
-#    capacity()
-    vaccines()
-    vaccine_demos()
+sources = [cases, case_demos, deaths, hospitalizations, hosp_region, vaccines, vaccine_demos]
+
+# Every runnable source by name, including ones left out of the daily run.
+all_sources = {source.__name__ : source for source in sources + [capacity]}
+
+hospital_charts = 'https://analytics.la.gov/t/LDH/views/URLDashboardHospitalizations/HospitalCharts'
+hospital_fields = ('DateTime-value', 'SUM(Covid Positive in Hospital)-value', 'SUM(Covid Positive on Vent)-alias')
+bed_fields = ('Bed Status-alias', 'Region-alias', 'SUM(Abs Diverging)-alias', 'SUM(Bed Count)-alias')
+
+# The worksheets, fields, filters and parameters each source reads, checked
+# by preflight before any source runs.
+requirements = {
+    **{name : [preflight.from_declaration(d)] for name, d in registry.declarations.items()},
+    'hospitalizations' : [preflight.Requirement(hospital_charts, 'Hospital and Vent Usage', hospital_fields)],
+    'hosp_region' : [preflight.Requirement(hospital_charts, 'Hospital and Vent Usage', hospital_fields, {'Region' : ()})],
+    'capacity' : [
+        preflight.Requirement('https://analytics.la.gov/t/LDH/views/URLDashboardHospitalizations/RegBedAvailability',
+                              'Hospital Reg Bed Availability', bed_fields),
+        preflight.Requirement('https://analytics.la.gov/t/LDH/views/URLDashboardHospitalizations/ICUBedAvailability',
+                              'Hospital ICU Bed Availability', bed_fields),
+    ],
+    'vaccine_demos' : [preflight.Requirement(
+        'https://analytics.la.gov/t/LDH/views/VaccinationDashboard2/VaccinationStatusbyAgeRaceGender',
+        'Cumulative Totals by Demographics',
+        ('Vaccination Status-value', 'Measure Group-alias', 'Measure-value', 'SUM(Value)-alias'),
+        {'area' : (), 'Measure Group' : ('Race', 'Gender', 'Age')})],
+}
+
+def main(export=False, max_workers=None, only=None, skip=None, date=None, check='skip'):
+    """
+    Runs the daily sources, or the ``only`` names given, minus ``skip``.
+    :param export: Also write the wide CSVs and forweb tables from the store
+    :param check: What to do with sources whose dashboards no longer have
+        the worksheets, fields or filters they read: 'skip' them, 'abort'
+        the run before anything is scraped, or 'off' to not check
+    """
+    set_update_date(date)
+    metrics.start_run()
+    selected = [all_sources[name] for name in only] if only else list(sources)
+    selected = [source for source in selected if source.__name__ not in (skip or [])]
+    ensure_loaded(pd, tableauscraper, store, revisions, workbooks, registry, preflight)
+    failed = {}
+    if check != 'off':
+        failed = preflight.check_sources({s.__name__ : requirements.get(s.__name__, []) for s in selected})
+        if failed and check == 'abort':
+            sys.exit(f"Preflight failed for {', '.join(sorted(failed))}; nothing was scraped.")
+        selected = [source for source in selected if source.__name__ not in failed]
+    skipped = [scheduler.SourceResult(name, False, 0.0, f'preflight: {problems}') for name, problems in failed.items()]
+    try:
+        results = scheduler.run_sources(selected, max_workers) + skipped
+        if export:
+            # One batch, so data/ never holds some of today's tables without the rest.
+            with staging.batch():
+                export_csv(sorted(written_datasets))
+                derived.build_all()
+            written_datasets.clear()
+    finally:
+        metrics.write_report('scrape')
+    if not all(r.ok for r in results):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,193 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import json
+import numpy as np
+import pandas as pd
+import metrics
+import staging
+import store
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+forweb_path = f'{module_path}/data/forweb'
+
+with open(f'{module_path}/static_data.json') as f:
+    population = pd.Series(json.load(f)['population'], dtype=float)
+
+# Source dataset and the prefix of the forweb tables derived from it.
+derived_datasets = {'cases' : 'Cases', 'deaths' : 'Deaths'}
+
+# Rows of the parish files that are not part of the statewide total.
+excluded_from_total = ['Probable (Statewide)']
+
+# Names the published tables give to rows of the matrix.
+row_labels = {'NewCases' : {'Louisiana' : 'Louisiana (including backlogged cases)'}}
+
+# Each derived value at date d depends on the cumulative values at these
+# offsets back from d: the value itself, the prior day (daily change) and a
+# week earlier (7-day average of the daily change).
+lags = (0, 1, 7)
+
+
+def cumulative(dataset):
+    """
+    Parish x date matrix of cumulative counts with a Louisiana total row,
+    read from the time-series store when the dataset is kept there.
+    """
+    if store.exists(dataset):
+        df = store.wide(dataset)
+    else:
+        df = pd.read_csv(f'{module_path}/data/{dataset}.csv', dtype={'FIPS': object})
+    id_columns, date_columns = store.split_columns(df)
+    df = df.dropna(subset=['County']).set_index('County')[date_columns].apply(pd.to_numeric, errors='coerce')
+    total = df.drop(index=excluded_from_total, errors='ignore').sum(min_count=1).rename('Louisiana')
+    df = pd.concat([total.to_frame().T, df])
+    df.index.name = 'Geography'
+    return df
+
+
+def read_table(name):
+    file = f'{forweb_path}/{name}.csv'
+    if not os.path.exists(file):
+        return None
+    return pd.read_csv(file)
+
+
+def merge(old, fresh, owned):
+    """
+    Writes the rows and columns of ``fresh`` into a published table as read
+    by read_table. Rows and columns the builder does not produce are kept
+    as they are, new ones are appended, and the table keeps its leading
+    index column and integer columns.
+    :param owned: Every column the builder produces, in order
+    """
+    leading = old.columns[0].startswith('Unnamed')
+    df = old.drop(columns=old.columns[0]) if leading else old
+    df = df.set_index('Geography')
+    integer = {c for c in df.columns if pd.api.types.is_integer_dtype(df[c])}
+    dates = [c for c in df.columns if c in owned and c != 'Population']
+    if dates and dates[-1] in integer:
+        integer |= {c for c in owned if c not in df.columns}
+    rows = list(df.index) + [g for g in fresh.index if g not in df.index]
+    columns = list(df.columns) + [c for c in owned if c not in df.columns]
+    df = df.reindex(index=rows, columns=columns)
+    df = df.astype({c: float for c in fresh.columns})
+    df.loc[fresh.index, fresh.columns] = fresh
+    # Int64 keeps whole numbers unformatted in columns with missing rows.
+    casts = {c: 'Int64' for c in integer if (df[c].dropna() % 1 == 0).all()}
+    # copy() consolidates the blocks the assignment split before the index is reinserted.
+    return df.astype(casts).copy().reset_index(), leading
+
+
+def with_earlier_days(matrix, published):
+    """
+    Prepends the days of the published cumulative table that precede the
+    store's first day, so they are kept and the first stored day still has
+    a prior day to difference against.
+    """
+    published = published.set_index('Geography')
+    first = store.iso_date(matrix.columns[0])
+    _, dates = store.split_columns(published)
+    earlier = [c for c in dates if store.iso_date(c) < first]
+    if not earlier:
+        return matrix
+    earlier = published.reindex(index=matrix.index, columns=earlier).apply(pd.to_numeric, errors='coerce')
+    return pd.concat([earlier, matrix], axis=1)
+
+
+def affected_positions(values, previous):
+    """
+    Positions of the date columns whose derived values can differ from the
+    previous build: columns that are new or revised, and the columns that
+    look back at them through ``lags``.
+    """
+    if previous is None:
+        return np.arange(values.shape[1])
+    changed = ~((values == previous) | (np.isnan(values) & np.isnan(previous))).all(axis=0)
+    affected = np.zeros_like(changed)
+    for lag in lags:
+        affected[lag:] |= changed[:len(changed) - lag]
+    return np.flatnonzero(affected)
+
+
+def lagged(values, positions, lag):
+    out = np.full((values.shape[0], len(positions)), np.nan)
+    valid = positions >= lag
+    out[:, valid] = values[:, positions[valid] - lag]
+    return out
+
+
+def build(dataset, prefix):
+    """
+    Updates the forweb tables derived from ``dataset``: cumulative counts,
+    daily change, 7-day average daily change, and per-100k rates of the
+    cumulative and daily figures. Only the date columns affected by new or
+    revised days are recomputed, as whole-array operations over the matrix,
+    and written into the existing tables; files whose contents are
+    unchanged are not rewritten.
+    """
+    tables = {
+        prefix : ('count', False),
+        f'New{prefix}' : ('new', False),
+        f'New{prefix}7Day' : ('avg7', False),
+        f'{prefix}100k' : ('count', True),
+        f'New{prefix}100k' : ('new', True),
+    }
+    previous = {name: read_table(name) for name in tables}
+    matrix = cumulative(dataset)
+    if previous[prefix] is not None:
+        matrix = with_earlier_days(matrix, previous[prefix])
+    labels = list(matrix.columns)
+    values = matrix.to_numpy(dtype=float)
+
+    pop = population.reindex(matrix.index).to_numpy()
+    per_100k = [g in population.index for g in matrix.index]
+    if any(p is None for p in previous.values()):
+        positions = affected_positions(values, None)
+    else:
+        prior = previous[prefix].set_index('Geography').reindex(index=matrix.index, columns=labels)
+        positions = affected_positions(values, prior.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float))
+    logger.info(f'Derived {prefix} tables: recomputing {len(positions)} of {len(labels)} dates.')
+    if len(positions) == 0:
+        return
+
+    current = values[:, positions]
+    computed = {
+        'count' : current,
+        'new' : current - lagged(values, positions, 1),
+        'avg7' : (current - lagged(values, positions, 7)) / 7,
+    }
+    for name, (measure, rate) in tables.items():
+        fresh = computed[measure]
+        index = matrix.index
+        if rate:
+            fresh = (fresh / pop[:, None] * 100000)[per_100k]
+            index = matrix.index[per_100k]
+        fresh = pd.DataFrame(fresh, index=index, columns=[labels[p] for p in positions])
+        owned = labels
+        if rate:
+            fresh.insert(0, 'Population', population.reindex(index))
+            owned = ['Population'] + labels
+        fresh = fresh.rename(index=row_labels.get(name, {}))
+        old = previous[name]
+        if old is None:
+            table, leading = fresh.reindex(columns=owned).reset_index(), False
+        else:
+            table, leading = merge(old, fresh, owned)
+        with metrics.stage('csv_write', name) as stage:
+            metrics.frame_size(stage, table)
+            staging.write_csv(table, f'{forweb_path}/{name}.csv', index=leading)
+        logger.info(f'Wrote {name}.csv')
+
+
+def build_all():
+    for dataset, prefix in derived_datasets.items():
+        build(dataset, prefix)
@@ -6,10 +6,16 @@ module_path = os.path.abspath(os.path.dirname(__file__))
 if module_path not in sys.path:
     sys.path.append(module_path)
 from urllib.request import urlopen
+from urllib.parse import quote, urlsplit
 import json
 from datetime import datetime, timedelta
-import pandas as pd
-from tableauscraper import TableauScraper as TS
+from lazy import lazy_import
+import arcgis
+import metrics
+
+pd = lazy_import('pandas')
+snapshots = lazy_import('snapshots')
+preflight = lazy_import('preflight')
 
 import logging
 
@@ -17,23 +23,36 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 log_date_fmt = "%Y-%m-%d %H:%M:%S"
 
-file_handler = logging.FileHandler(filename='covid_la.log', mode='w')
-stdout_handler = logging.StreamHandler(sys.stdout)
+def setup_logging(target=None, mode='a'):
+    """
+    Attaches the covid_la.log file and stdout handlers to ``target`` (this
+    module's logger by default). Called when a run starts rather than on
+    import, and appends by default so a partial run does not clobber the log.
+    """
+    target = target or logger
+    file_handler = logging.FileHandler(filename='covid_la.log', mode=mode)
+    stdout_handler = logging.StreamHandler(sys.stdout)
+
+    file_handler.setLevel(logging.DEBUG)
+    stdout_handler.setLevel(logging.DEBUG)
 
-file_handler.setLevel(logging.DEBUG)
-stdout_handler.setLevel(logging.DEBUG)
+    file_log_format = logging.Formatter('[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s', log_date_fmt)
+    stdout_log_format = logging.Formatter('[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s', log_date_fmt)
 
-file_log_format = logging.Formatter('[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s', log_date_fmt)
-stdout_log_format = logging.Formatter('[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s', log_date_fmt)
+    file_handler.setFormatter(file_log_format)
+    stdout_handler.setFormatter(stdout_log_format)
 
-file_handler.setFormatter(file_log_format)
-stdout_handler.setFormatter(stdout_log_format)
+    target.addHandler(file_handler)
+    target.addHandler(stdout_handler)
 
-logger.addHandler(file_handler)
-logger.addHandler(stdout_handler)
+_static_data = None
 
-with open(f'{module_path}/static_data.json') as f:
-    static_data = json.load(f)
+def static_data():
+    global _static_data
+    if _static_data is None:
+        with open(f'{module_path}/static_data.json') as f:
+            _static_data = json.load(f)
+    return _static_data
 
 update_date = datetime.now()
 if os.name == 'nt':
@@ -41,8 +60,8 @@ if os.name == 'nt':
 else:
     update_date_string = update_date.strftime('%-m/%-d/%Y')
 file_date = f'{update_date.year}{update_date.month}{update_date.day}'
-url_prefix = 'https://services5.arcgis.com/O5K6bb5dZVZcTo5M/ArcGIS/rest/services/'
-url_suffix = '/FeatureServer/0/query?where=1%3D1&outFields=*&f=pjson&token='
+url_prefix = arcgis.url_prefix
+url_suffix = '/FeatureServer/0/query?where=1%3D1&outFields=*&f=json&token='
 
 
 def tract_date():
@@ -61,6 +80,16 @@ needed_datasets = {'cases_deaths_primary' : 'test_this_sheet',  # Main LDH cases
                    'vaccine_full_demo' : 'Louisiana_Vaccination_Full_Demographics',
                    'tracts': 'Louisiana_COVID_Cases_by_Tract'}
 
+# outFields to request for a needed dataset, keyed like needed_datasets, as
+# a comma-separated field list. Datasets not listed here fetch every field.
+needed_fields = {}
+
+def out_fields(dataset):
+    for key, name in needed_datasets.items():
+        if name == dataset:
+            return needed_fields.get(key, '*')
+    return '*'
+
 
 def get_datasets():
     try:
@@ -83,8 +112,8 @@ def get_datasets():
 
 def compare_datasets(current_ldh_datasets):
     try:
-        added = set(current_ldh_datasets) - set(static_data["prior_datasets"])
-        deleted = set(static_data["prior_datasets"]) - set(current_ldh_datasets)
+        added = set(current_ldh_datasets) - set(static_data()["prior_datasets"])
+        deleted = set(static_data()["prior_datasets"]) - set(current_ldh_datasets)
         logger.info("Comparing datasets list against known LDH datasets.")
         if len(added) > 0:
             logger.warning(f'Found {len(added)} new datasets:')
@@ -127,36 +156,98 @@ def check_datasets(current_ldh_datasets):
         logger.error(str(e))
         sys.exit(1)
 
+def esri_batches(url, state):
+    """
+    Streams the attribute records of one query response as DataFrame
+    batches; see arcgis.parse_features.
+    """
+    with metrics.stage('arcgis_fetch', urlsplit(url).path) as stage, urlopen(url) as response:
+        stage['rows'] = 0
+        for df in arcgis.parse_features(response, state):
+            stage['rows'] += len(df)
+            yield df
+
 def esri_cleaner(url):
-    data = urlopen(url).read()
-    raw_json = json.loads(data)
-    formatted_json = [feature['attributes'] for feature in raw_json['features']]
-    return formatted_json
-
-def download(dataset):
-    offset=0
-    record_count = 2000
-
-    combined = pd.DataFrame()
-    while record_count == 2000:
-        batch_records = pd.DataFrame(esri_cleaner(url_prefix + dataset + url_suffix + f'&resultOffset={offset}'))
-        combined = combined.append(batch_records)
-        offset = len(batch_records)
-        record_count = len(batch_records)
-    return combined
-
-def download_all():
-    datasets = get_datasets()
-    for d in datasets:
-        try:
-            if d != 'Blocks_2010_Pop_Only_Comprehensive_Coastline' and d != 'Census_Block_Groups_2010_Comprehensive_Coastline' and d != 'Census_Tracts_2010_Comprehensive_Coastline':
-                print(d)
-                df = pd.DataFrame(download(d))
-                df.to_csv(f"{module_path}/data/full_datasets/{d}{datetime.now().strftime('%Y-%m-%d')}.csv")
-        except:
-            pass
+    return [row for df in esri_batches(url, {}) for row in df.to_dict('records')]
+
+def pages(dataset):
+    """
+    Yields the attribute records of a FeatureServer layer as DataFrame
+    batches. The offset advances by the rows actually returned and paging
+    stops when the server no longer sets exceededTransferLimit, so any server
+    page size works.
+    """
+    offset = 0
+    suffix = url_suffix.replace('outFields=*', f'outFields={quote(out_fields(dataset))}')
+    while True:
+        state = {}
+        returned = 0
+        for df in esri_batches(url_prefix + dataset + suffix + f'&resultOffset={offset}', state):
+            returned += len(df)
+            yield df
+        offset += returned
+        if not state['exceeded'] or not returned:
+            break
+
+def download(dataset, file=None):
+    """
+    Downloads every record of a dataset. With ``file`` each page is appended
+    to that CSV as it arrives, so memory stays bounded by the page size, and
+    the number of rows written is returned. Without it the pages are
+    concatenated once into a DataFrame.
+    """
+    if file is None:
+        frames = list(pages(dataset))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    rows = 0
+    columns = None
+    part = f'{file}.part'
+    for df in pages(dataset):
+        if columns is None:
+            columns = list(df.columns)
+        df = df.reindex(columns=columns)
+        df.index = range(rows, rows + len(df))
+        df.to_csv(part, mode='w' if rows == 0 else 'a', header=rows == 0)
+        rows += len(df)
+    if rows == 0:
+        pd.DataFrame().to_csv(part)
+    os.replace(part, file)
+    return rows
+
+# Basemap layers that are large, static and not LDH data.
+skipped_datasets = ['Blocks_2010_Pop_Only_Comprehensive_Coastline',
+                    'Census_Block_Groups_2010_Comprehensive_Coastline',
+                    'Census_Tracts_2010_Comprehensive_Coastline']
+
+manifest_path = f"{module_path}/data/full_datasets/manifest.json"
+
+def download_all(workers=4, incremental=True, link=False, keep_csv=False):
+    """
+    Downloads every LDH layer and adds each new snapshot to the
+    deduplicating snapshot store. Unless ``keep_csv`` is set the plain daily
+    CSV is removed once it is archived; use snapshots.materialize to read a
+    dataset as of any date.
+    """
+    date = datetime.now().strftime('%Y-%m-%d')
+    datasets = [d for d in get_datasets() if d not in skipped_datasets]
+    failed = preflight.check_layers(datasets, {d: out_fields(d) for d in datasets}, workers)
+    datasets = [d for d in datasets if d not in failed]
+    reports = arcgis.download_all(datasets, f"{module_path}/data/full_datasets", date,
+                                  workers, manifest_path if incremental else None, link,
+                                  {d: out_fields(d) for d in datasets})
+    for r in reports:
+        if r.error is not None or r.failed_pages:
+            logger.error(f'INCOMPLETE: {r.dataset} ({len(r.failed_pages)} of {r.pages} pages failed, error: {r.error!r})')
+            continue
+        file = f"{module_path}/data/full_datasets/{r.dataset}{date}.csv"
+        if os.path.exists(file):
+            snapshots.add(r.dataset, date, file)
+            if not keep_csv:
+                os.remove(file)
+    return reports
 
 def main():
+    metrics.start_run()
     try:
         download_all()
     except Exception as e:
@@ -164,7 +255,10 @@ def main():
         logger.error(str(e))
 
         sys.exit(1)
+    finally:
+        metrics.write_report('download')
 
 if __name__ == "__main__":
+    setup_logging(mode='w')
     main()
 
@@ -0,0 +1,286 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import hashlib
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+import arcgis
+import scheduler
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+fixtures_path = f'{module_path}/fixtures'
+
+
+session_pattern = re.compile(r'/sessions/[^/?]+')
+
+
+def _key(method, url, body=None, params=None):
+    """
+    Request identity for a cassette: method, URL with its query parameters
+    and the Tableau session id replaced (a replayed session gets whichever id
+    was recorded), and a hash of the form, JSON or multipart body.
+    """
+    url = session_pattern.sub('/sessions/-', url)
+    if params:
+        url += ('&' if '?' in url else '?') + urlencode(sorted(dict(params).items()))
+    if isinstance(body, str):
+        body = body.encode()
+    elif isinstance(body, (dict, list, tuple)):
+        body = json.dumps(body, sort_keys=True, default=str).encode()
+    digest = hashlib.sha1(body).hexdigest() if body else ''
+    return f'{method.upper()} {url} {digest}'
+
+
+def _body(kwargs):
+    return kwargs.get('data') or kwargs.get('json') or kwargs.get('files')
+
+
+@contextmanager
+def _serial_filters():
+    # Requests that repeat within a session are told apart by their order,
+    # so filter sweeps run one value at a time while recording or replaying.
+    saved = scheduler.filter_workers
+    scheduler.filter_workers = 1
+    try:
+        yield
+    finally:
+        scheduler.filter_workers = saved
+
+
+class Cassette:
+    """
+    Recorded HTTP responses for one scenario, stored as index.json plus one
+    body file per response under ``directory``. Requests are matched by
+    _key; a request made more than once is answered with its recorded
+    responses in order, the last one repeating.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        index = f'{directory}/index.json'
+        self.index = {}
+        self.served = {}
+        if os.path.exists(index):
+            with open(index) as f:
+                self.index = json.load(f)
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f'{self.directory}/index.json', 'w') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+
+    def put(self, key, status, headers, content):
+        with self.lock:
+            entries = self.index.setdefault(key, [])
+            name = f'{hashlib.sha1(key.encode()).hexdigest()}-{len(entries)}.bin'
+            entries.append({'status': status, 'headers': dict(headers), 'file': name})
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f'{self.directory}/{name}', 'wb') as f:
+            f.write(content)
+
+    def get(self, key):
+        entries = self.index.get(key)
+        if not entries:
+            raise KeyError(f'No recorded response for {key}')
+        with self.lock:
+            n = self.served.get(key, 0)
+            self.served[key] = n + 1
+        entry = entries[min(n, len(entries) - 1)]
+        with open(f"{self.directory}/{entry['file']}", 'rb') as f:
+            return entry['status'], entry['headers'], f.read()
+
+    def find(self, path_and_query):
+        """
+        Looks up a recorded GET by path and query alone, for requests that
+        arrive at the stand-in server with a different host.
+        """
+        for key in self.index:
+            method, url, _ = key.split(' ')
+            parts = urlsplit(url)
+            if method == 'GET' and parts.path + (f'?{parts.query}' if parts.query else '') == path_and_query:
+                return self.get(key)
+        raise KeyError(f'No recorded response for GET {path_and_query}')
+
+
+class NetworkTimer:
+    """
+    Accumulates wall-clock time spent waiting on (real or replayed) network
+    calls, so benchmarks can split it from parse, transform and write time.
+    """
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.seconds += seconds
+            self.calls += 1
+
+
+@contextmanager
+def record(name, timer=None):
+    """
+    Records every Tableau (requests) and ArcGIS response made inside the
+    block into the cassette ``fixtures/<name>``. Filter sweeps run serially
+    so that replay sees requests in the recorded order.
+    """
+    import requests
+    cassette = Cassette(f'{fixtures_path}/{name}')
+    original_request = requests.Session.request
+    original_fetch = arcgis.fetch
+
+    def request(session, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        response = original_request(session, method, url, *args, **kwargs)
+        if timer:
+            timer.add(time.perf_counter() - start)
+        cassette.put(_key(method, url, _body(kwargs), kwargs.get('params')), response.status_code,
+                     {'Content-Type': response.headers.get('Content-Type', '')}, response.content)
+        return response
+
+    def fetch(url):
+        start = time.perf_counter()
+        content = original_fetch(url)
+        if timer:
+            timer.add(time.perf_counter() - start)
+        cassette.put(_key('GET', url), 200, {'Content-Type': 'application/json'}, content)
+        return content
+
+    requests.Session.request = request
+    arcgis.fetch = fetch
+    try:
+        with _serial_filters():
+            yield cassette
+    finally:
+        requests.Session.request = original_request
+        arcgis.fetch = original_fetch
+        cassette.save()
+
+
+@contextmanager
+def replay(name, latency=0.0, timer=None):
+    """
+    Serves responses from the cassette ``fixtures/<name>`` instead of the
+    network, sleeping ``latency`` seconds per request to model round trips.
+    Tableau requests are answered in-process; ArcGIS requests are served by a
+    local stand-in server that arcgis.url_prefix is pointed at.
+    """
+    import requests
+    cassette = Cassette(f'{fixtures_path}/{name}')
+    original_request = requests.Session.request
+
+    def request(session, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        time.sleep(latency)
+        status, headers, content = cassette.get(_key(method, url, _body(kwargs), kwargs.get('params')))
+        response = requests.models.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = content
+        response.url = url
+        if timer:
+            timer.add(time.perf_counter() - start)
+        return response
+
+    requests.Session.request = request
+    try:
+        with stand_in(cassette=cassette, latency=latency, timer=timer), _serial_filters():
+            yield cassette
+    finally:
+        requests.Session.request = original_request
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    Local stand-in FeatureServer. Answers from a cassette when one is given,
+    otherwise from a synthetic layer of ``rows`` records served in pages of
+    ``page_size`` with ArcGIS's paging fields.
+    """
+    server_version = 'StandInFeatureServer'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        start = time.perf_counter()
+        time.sleep(self.server.latency)
+        if self.server.cassette is not None:
+            try:
+                status, headers, content = self.server.cassette.find(self.path)
+            except KeyError:
+                self.send_error(404)
+                return
+        else:
+            status, headers, content = 200, {'Content-Type': 'application/json'}, self._synthetic()
+        self.send_response(status)
+        for k, v in headers.items():
+            if k.lower() not in ('content-length', 'transfer-encoding', 'connection'):
+                self.send_header(k, v)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        if self.server.timer:
+            self.server.timer.add(time.perf_counter() - start)
+
+    def _synthetic(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        rows, page_size = self.server.rows, self.server.page_size
+        if not url.path.endswith('/query'):
+            return json.dumps({'maxRecordCount': self.server.max_record_count or page_size, 'objectIdField': 'OBJECTID',
+                               'editingInfo': {'lastEditDate': 0},
+                               'fields': [{'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+                                          {'name': 'Value', 'type': 'esriFieldTypeInteger'}]}).encode()
+        if params.get('returnCountOnly') == 'true':
+            return json.dumps({'count': rows}).encode()
+        offset = int(params.get('resultOffset', 0))
+        count = min(int(params.get('resultRecordCount', page_size)), page_size)
+        end = min(rows, offset + count)
+        features = [{'attributes': {'OBJECTID': i + 1, 'Parish': f'Parish {i % 64}', 'Value': i}} for i in range(offset, end)]
+        return json.dumps({'features': features, 'exceededTransferLimit': end < rows}).encode()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def stand_in(cassette=None, rows=0, page_size=2000, latency=0.0, timer=None, max_record_count=None):
+    """
+    Runs a stand-in FeatureServer on a free local port and points
+    arcgis.url_prefix (and download_data.url_prefix, if imported) at it for
+    the duration of the block.
+    :param max_record_count: The maxRecordCount the synthetic layer reports,
+        to stand in for servers that serve shorter pages than they advertise
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    server.cassette, server.rows, server.page_size = cassette, rows, page_size
+    server.max_record_count = max_record_count
+    server.latency, server.timer = latency, timer
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    prefix = f'http://127.0.0.1:{server.server_address[1]}{urlsplit(arcgis.url_prefix).path}'
+    download_data = sys.modules.get('download_data')
+    saved = arcgis.url_prefix, getattr(download_data, 'url_prefix', None)
+    arcgis.url_prefix = prefix
+    if download_data is not None:
+        download_data.url_prefix = prefix
+    try:
+        yield server
+    finally:
+        arcgis.url_prefix = saved[0]
+        if download_data is not None:
+            download_data.url_prefix = saved[1]
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,31 @@
+#!env/bin/python
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Returns module ``name`` without executing it until one of its attributes
+    is first used, so scripts only pay for pandas, tableauscraper and the
+    store modules when a command actually needs them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def ensure_loaded(*modules):
+    """
+    Finishes loading lazily imported modules. Called before work is handed
+    to threads so two threads never race to execute the same module.
+    """
+    for module in modules:
+        module.__dict__
@@ -0,0 +1,175 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+metrics_path = os.environ.get('COVID_LA_METRICS_DIR', f'{module_path}/metrics')
+
+_events = []
+_counters = defaultdict(int)
+_lock = threading.Lock()
+_run_started = time.time()
+
+
+def start_run():
+    global _run_started
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _run_started = time.time()
+
+
+@contextmanager
+def stage(kind, name, **fields):
+    """
+    Times one hot-path step (a source, a Tableau load or filter, an ArcGIS
+    page, a store append, a CSV write). The yielded dict can be filled in with
+    ``bytes``, ``rows``, ``columns`` or anything else worth reporting.
+    """
+    event = {'kind': kind, 'name': name, 'thread': threading.current_thread().name, **fields}
+    start = time.perf_counter()
+    event['start'] = time.time() - _run_started
+    try:
+        yield event
+    except BaseException as e:
+        event['error'] = repr(e)
+        raise
+    finally:
+        event['seconds'] = time.perf_counter() - start
+        with _lock:
+            _events.append(event)
+
+
+def count(counter, name, amount=1):
+    with _lock:
+        _counters[(counter, name)] += amount
+
+
+def frame_size(event, df):
+    event['rows'], event['columns'] = df.shape
+
+
+def summary():
+    """
+    Events aggregated by (kind, name): calls, total seconds, errors and the
+    summed bytes and rows.
+    """
+    totals = defaultdict(lambda: defaultdict(float))
+    with _lock:
+        events = list(_events)
+    for e in events:
+        t = totals[(e['kind'], e['name'])]
+        t['calls'] += 1
+        t['seconds'] += e['seconds']
+        t['errors'] += 'error' in e
+        for field in ('bytes', 'rows'):
+            t[field] += e.get(field) or 0
+    return totals
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus():
+    lines = ['# HELP covid_la_stage_seconds Seconds spent in each pipeline stage during the last run.',
+             '# TYPE covid_la_stage_seconds gauge']
+    totals = summary()
+    series = {'seconds': 'covid_la_stage_seconds', 'calls': 'covid_la_stage_calls',
+              'errors': 'covid_la_stage_errors', 'bytes': 'covid_la_stage_bytes', 'rows': 'covid_la_stage_rows'}
+    for field, metric in series.items():
+        if field != 'seconds':
+            lines.append(f'# TYPE {metric} gauge')
+        for (kind, name), t in sorted(totals.items()):
+            lines.append(f'{metric}{{kind="{_label(kind)}",name="{_label(name)}"}} {t[field]:g}')
+    lines.append('# TYPE covid_la_count gauge')
+    with _lock:
+        counters = dict(_counters)
+    for (counter, name), value in sorted(counters.items()):
+        lines.append(f'covid_la_count{{counter="{_label(counter)}",name="{_label(name)}"}} {value}')
+    lines.append('# TYPE covid_la_last_run_timestamp_seconds gauge')
+    lines.append(f'covid_la_last_run_timestamp_seconds {time.time():.0f}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(run='run', directory=None):
+    """
+    Writes the run's events and counters to <directory>/<run>-<timestamp>.json
+    and the aggregated metrics to <directory>/<run>.prom for the node
+    exporter textfile collector. Both are written atomically.
+    :returns: The path of the JSON report
+    """
+    directory = directory or metrics_path
+    os.makedirs(directory, exist_ok=True)
+    with _lock:
+        report = {'run': run, 'started': datetime.fromtimestamp(_run_started).isoformat(timespec='seconds'),
+                  'seconds': time.time() - _run_started, 'events': list(_events),
+                  'counters': [{'counter': c, 'name': n, 'value': v} for (c, n), v in _counters.items()]}
+    path = f"{directory}/{run}-{datetime.fromtimestamp(_run_started).strftime('%Y%m%d-%H%M%S')}.json"
+    for target, content in [(path, json.dumps(report, indent=1, default=str)), (f'{directory}/{run}.prom', prometheus())]:
+        with open(f'{target}.tmp', 'w') as f:
+            f.write(content)
+        os.replace(f'{target}.tmp', target)
+    logger.info(f'Wrote run metrics to {path}')
+    return path
+
+
+@contextmanager
+def profile(path=None, top=30):
+    """
+    Runs the block under cProfile, including the threads started inside it
+    (sources, filter sweeps, page downloads), whose stats are merged with
+    the calling thread's. Stats are dumped to ``path`` when given and the
+    ``top`` entries by cumulative time are logged.
+    """
+    if path is None and not top:
+        yield
+        return
+    profilers = [cProfile.Profile()]
+    guard = threading.Lock()
+    # From 3.12 cProfile uses sys.monitoring, which already sees every
+    # thread and allows only one active profiler.
+    per_thread = sys.version_info < (3, 12)
+
+    def start(frame, event, arg):
+        # The first profile event of a new thread: hand the thread to a
+        # profiler of its own, which replaces this hook.
+        profiler = cProfile.Profile()
+        with guard:
+            profilers.append(profiler)
+        profiler.enable()
+
+    if per_thread:
+        threading.setprofile(start)
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        profilers[0].disable()
+        if per_thread:
+            threading.setprofile(None)
+        out = io.StringIO()
+        with guard:
+            stats = pstats.Stats(*profilers, stream=out)
+        if path:
+            stats.dump_stats(path)
+        if top:
+            stats.sort_stats('cumulative').print_stats(top)
+            logger.info(out.getvalue())
@@ -0,0 +1,231 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import json
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from lazy import lazy_import, ensure_loaded
+import metrics
+
+workbooks = lazy_import('workbooks')
+arcgis = lazy_import('arcgis')
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+schema_path = f'{module_path}/data/schema.json'
+
+# What one source reads from one dashboard view: a worksheet and its fields,
+# filters ({column: values the source selects}) and parameters ({name: value}).
+# With parameters, the worksheet is checked in the view as it is after they
+# are set, since it may only be shown then.
+Requirement = namedtuple('Requirement', ['url', 'worksheet', 'fields', 'filters', 'parameters'],
+                         defaults=[(), None, None])
+
+_schema_lock = threading.Lock()
+
+
+def from_declaration(declaration):
+    d = declaration
+    parameters = {d.parameter[0]: d.parameter[1]} if d.parameter else None
+    return Requirement(d.url, d.worksheet, tuple((d.columns or {}).keys()), None, parameters)
+
+
+def load_schema(path=None):
+    path = path or schema_path
+    if not os.path.exists(path):
+        return {'tableau': {}, 'arcgis': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_schema(schema, path=None):
+    path = path or schema_path
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(schema, f, indent=1, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
+
+def _worksheets(workbook):
+    return {ws.name: {'fields': sorted(ws.data.columns),
+                      'filters': {f['column']: list(f['values']) for f in ws.getFilters()}}
+            for ws in workbook.worksheets}
+
+
+def view_schema(url):
+    """
+    The worksheets, fields, filters and parameters of a dashboard view as
+    loaded by workbooks.scraper, so the sources reuse the same session.
+    """
+    workbook = workbooks.scraper(url).getWorkbook()
+    parameters = {p['column']: list(p['values']) for p in workbook.getParameters()}
+    return {'worksheets': _worksheets(workbook), 'parameters': parameters}
+
+
+def parameter_schema(url, parameters):
+    """
+    The worksheets of a view after ``parameters`` are set, on a session of
+    its own so the shared session is not left changed.
+    """
+    ts = workbooks.TS(logLevel='ERROR')
+    with metrics.stage('tableau_load', url):
+        ts.loads(url)
+    workbook = ts.getWorkbook()
+    for name, value in parameters.items():
+        workbook = workbook.setParameter(name, value)
+    return {'worksheets': _worksheets(workbook)}
+
+
+def _applied_key(requirement):
+    return requirement.url, tuple(sorted(requirement.parameters.items()))
+
+
+def problems(requirement, schema, applied=None):
+    """
+    What the view is missing that the requirement needs, as messages.
+    :param applied: The view's schema with the requirement's parameters set;
+        without it only the parameters themselves are checked
+    """
+    r = requirement
+    found = []
+    if r.parameters:
+        for name, value in r.parameters.items():
+            if name not in schema['parameters']:
+                found.append(f'parameter {name!r} missing')
+            elif value not in schema['parameters'][name]:
+                found.append(f'parameter {name!r} has no value {value!r}')
+        if found or applied is None:
+            return found
+        schema = applied
+    sheet = schema['worksheets'].get(r.worksheet)
+    if sheet is None:
+        return [f'worksheet {r.worksheet!r} missing']
+    found += [f'field {f!r} missing from {r.worksheet!r}' for f in r.fields if f not in sheet['fields']]
+    for column, values in (r.filters or {}).items():
+        if column not in sheet['filters']:
+            found.append(f'filter {column!r} missing from {r.worksheet!r}')
+        else:
+            found += [f'filter {column!r} has no value {v!r}' for v in values if v not in sheet['filters'][column]]
+    return found
+
+
+def drift(previous, current):
+    """
+    Differences from the last recorded schema of a view, for the log. Only
+    what the sources declare they need decides whether they run.
+    """
+    changes = []
+    before, after = previous.get('worksheets', {}), current['worksheets']
+    changes += [f'worksheet {w!r} removed' for w in before.keys() - after.keys()]
+    changes += [f'worksheet {w!r} added' for w in after.keys() - before.keys()]
+    for w in before.keys() & after.keys():
+        changes += [f'{w!r} lost field {f!r}' for f in set(before[w]['fields']) - set(after[w]['fields'])]
+        changes += [f'{w!r} gained field {f!r}' for f in set(after[w]['fields']) - set(before[w]['fields'])]
+        changes += [f'{w!r} lost filter {f!r}' for f in before[w]['filters'].keys() - after[w]['filters'].keys()]
+    changes += [f'parameter {p!r} removed' for p in previous.get('parameters', {}).keys() - current['parameters'].keys()]
+    return changes
+
+
+def check_sources(requirements, workers=4, path=None):
+    """
+    Loads each dashboard view once and checks every source's requirements
+    against it.
+    :param requirements: {source name: [Requirement, ...]}
+    :returns: {source name: [problem, ...]} for the sources that would fail
+    """
+    ensure_loaded(workbooks)
+    schema = load_schema(path)
+    urls = sorted({r.url for reqs in requirements.values() for r in reqs})
+    views = {}
+    applied = {}
+
+    def inspect(url):
+        with metrics.stage('preflight', url):
+            try:
+                views[url] = view_schema(url)
+            except Exception as e:
+                # Unreachable is not drift; the source's own retries handle it.
+                logger.warning(f'Preflight could not load {url} ({e!r})')
+                return
+        if url in schema['tableau']:
+            for change in drift(schema['tableau'][url], views[url]):
+                logger.warning(f'SCHEMA CHANGED: {url}: {change}')
+
+    def apply(key):
+        url, parameters = key
+        with metrics.stage('preflight', url):
+            try:
+                applied[key] = parameter_schema(url, dict(parameters))
+            except Exception as e:
+                logger.warning(f'Preflight could not set {dict(parameters)} on {url} ({e!r})')
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preflight') as pool:
+        list(pool.map(inspect, urls))
+        keys = {_applied_key(r) for reqs in requirements.values() for r in reqs
+                if r.parameters and r.url in views and not problems(r, views[r.url])}
+        list(pool.map(apply, sorted(keys)))
+
+    failed = {}
+    for name, reqs in requirements.items():
+        found = [p for r in reqs if r.url in views
+                 for p in problems(r, views[r.url], applied.get(_applied_key(r)) if r.parameters else None)]
+        if found:
+            failed[name] = found
+            logger.error(f"PREFLIGHT FAILED: {name}: {'; '.join(found)}")
+    with _schema_lock:
+        schema = load_schema(path)
+        schema['tableau'].update(views)
+        save_schema(schema, path)
+    return failed
+
+
+def check_layers(datasets, fields=None, workers=4, path=None):
+    """
+    Fetches each ArcGIS layer's field list and checks the fields requested
+    for it are still there.
+    :param fields: {dataset: comma-separated outFields}; '*' needs nothing
+    :returns: {dataset: [problem, ...]} for the layers that would fail
+    """
+    ensure_loaded(arcgis)
+    schema = load_schema(path)
+    fields = fields or {}
+    current = {}
+
+    def inspect(dataset):
+        with metrics.stage('preflight', dataset):
+            try:
+                current[dataset] = [f['name'] for f in arcgis.layer_info(dataset).get('fields', [])]
+            except Exception as e:
+                logger.warning(f'Preflight could not read the fields of {dataset} ({e!r})')
+                return
+        previous = schema['arcgis'].get(dataset)
+        if previous is not None:
+            for f in set(previous) - set(current[dataset]):
+                logger.warning(f'SCHEMA CHANGED: {dataset} lost field {f!r}')
+            for f in set(current[dataset]) - set(previous):
+                logger.warning(f'SCHEMA CHANGED: {dataset} gained field {f!r}')
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preflight') as pool:
+        list(pool.map(inspect, datasets))
+
+    failed = {}
+    for dataset in datasets:
+        wanted = fields.get(dataset, '*')
+        if dataset not in current or wanted == '*':
+            continue
+        missing = [f for f in wanted.split(',') if f not in current[dataset]]
+        if missing:
+            failed[dataset] = [f'field {f!r} missing' for f in missing]
+            logger.error(f"PREFLIGHT FAILED: {dataset}: {'; '.join(failed[dataset])}")
+    with _schema_lock:
+        schema = load_schema(path)
+        schema['arcgis'].update(current)
+        save_schema(schema, path)
+    return failed
@@ -0,0 +1,189 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import hashlib
+import json
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+import store
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+data_path = f'{module_path}/data'
+
+# Identifier columns of the wide CSVs that name a row's geography and
+# category, in order of preference; any other identifier columns are dropped.
+geography_columns = ('Geography', 'Parish', 'County', 'LDH Region', 'Region')
+category_columns = ('Category', 'Race')
+
+
+def csv_file(dataset):
+    """
+    The wide CSV serving a dataset that is not in the store: data/<name>.csv,
+    or data/forweb/<name>.csv for 'forweb/<name>'.
+    """
+    parts = dataset.split('/')
+    if parts[:1] == ['forweb'] and len(parts) == 2:
+        parts = parts[1:]
+        directory = f'{data_path}/forweb'
+    else:
+        directory = data_path
+    if len(parts) != 1 or not parts[0] or parts[0].startswith('.'):
+        return None
+    file = f'{directory}/{parts[0]}.csv'
+    return file if os.path.isfile(file) else None
+
+
+def read_wide(file):
+    """
+    The long (geography, category, date, value) rows of a wide CSV with one
+    column per day.
+    """
+    df = pd.read_csv(file)
+    df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+    id_columns, date_columns = store.split_columns(df)
+    if not date_columns:
+        raise KeyError(f'{os.path.basename(file)} has no date columns')
+    geography = next((c for c in geography_columns if c in id_columns), None)
+    category = next((c for c in category_columns if c in id_columns), None)
+    values = df[date_columns].apply(pd.to_numeric, errors='coerce')
+    values.columns = [store.iso_date(c) for c in date_columns]
+    values.insert(0, 'geography', df[geography].astype(str) if geography else '')
+    values.insert(1, 'category', df[category].astype(str) if category else '')
+    df = values.melt(id_vars=['geography', 'category'], var_name='date', value_name='value').dropna(subset=['value'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+class SeriesCache:
+    """
+    Read-side cache over the time-series store. Each dataset is loaded once
+    into a frame indexed by (geography, category, date) and reloaded only
+    when the store reports a newer write for it, so a source writing new
+    data invalidates the cache without any explicit signal. Datasets not in
+    the store are read from their wide CSV (see csv_file) and reloaded when
+    the file changes.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.frames = {}
+        self.lock = threading.Lock()
+
+    def _frame(self, dataset):
+        modified = store.modified(dataset, self.path)
+        file = None
+        if modified is None:
+            file = csv_file(dataset)
+            if file is None:
+                raise KeyError(dataset)
+            modified = os.path.getmtime(file)
+        with self.lock:
+            cached = self.frames.get(dataset)
+            if cached is None or cached[0] != modified:
+                df = store.load(dataset, path=self.path) if file is None else read_wide(file)
+                df['category'] = df['category'].fillna('')
+                df = df.set_index(['geography', 'category', 'date']).sort_index()
+                cached = self.frames[dataset] = (modified, df)
+        return cached
+
+    def modified(self, dataset):
+        return self._frame(dataset)[0]
+
+    def query(self, dataset, geography=None, category=None, start=None, end=None):
+        """
+        Returns the long (geography, category, date, value) rows matching
+        the given geography, category and inclusive date range.
+        """
+        df = self._frame(dataset)[1]
+        idx = pd.IndexSlice
+        df = df.loc[idx[geography if geography is not None else slice(None),
+                        category if category is not None else slice(None),
+                        slice(pd.Timestamp(start) if start else None, pd.Timestamp(end) if end else None)], :]
+        return df.reset_index()
+
+
+cache = SeriesCache()
+
+
+def render(df, fmt):
+    df = df.assign(date=df['date'].dt.strftime('%Y-%m-%d'))
+    if fmt == 'csv':
+        return df.to_csv(index=False).encode(), 'text/csv'
+    return json.dumps(df.to_dict('records')).encode(), 'application/json'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    GET /<dataset>?geography=&category=&start=&end=&format=json|csv
+
+    ``dataset`` is a store dataset, another data/ CSV such as
+    cases_deaths_by_race_parish, or forweb/<table> for the data/forweb tables.
+
+    Responses carry an ETag derived from the dataset's last write and the
+    query, plus Last-Modified, so pollers get 304 Not Modified until the
+    data changes.
+    """
+    def do_GET(self):
+        url = urlsplit(self.path)
+        dataset = url.path.strip('/')
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        fmt = params.pop('format', 'json')
+        try:
+            modified = cache.modified(dataset)
+        except KeyError:
+            self.send_error(404, f'Unknown dataset {dataset}')
+            return
+        etag = '"' + hashlib.sha1(f'{modified}{url.query}'.encode()).hexdigest() + '"'
+        last_modified = formatdate(modified, usegmt=True)
+        if self.headers.get('If-None-Match') == etag or self._not_modified_since(modified):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            return
+        try:
+            df = cache.query(dataset, **{k: params.get(k) for k in ('geography', 'category', 'start', 'end')})
+        except (KeyError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+        body, content_type = render(df, fmt)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_modified_since(self, modified):
+        since = self.headers.get('If-Modified-Since')
+        if not since or self.headers.get('If-None-Match'):
+            return False
+        try:
+            return int(modified) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def log_message(self, format, *args):
+        logger.info(format % args)
+
+
+def serve(host='127.0.0.1', port=8000):
+    server = ThreadingHTTPServer((host, port), Handler)
+    logger.info(f'Serving the time-series store on http://{host}:{port}/')
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
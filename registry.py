@@ -0,0 +1,167 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import functools
+import string
+from collections import namedtuple
+from lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# A Tableau source described as data; covid_la.declared turns it into a source
+# function. Transform steps run in field order:
+#   columns  rename map; the measure must be renamed to 'value' unless melt is used
+#   exclude  {column: [values]} rows to drop
+#   replace  {column: {old: new}} value mapping
+#   regions  columns holding 'N - Name' LDH regions, relabelled 'Region N'
+#   group    (keys, aggregation) passed to groupby().agg()
+#   melt     (id columns, value columns); the value column names become Category
+#   total    (geography, category template) for a summed row per Category
+#   category template for the Category column of the detail rows
+#   split    (column, {value: dataset}) to store one dataset per value
+#   dataset  the dataset written when there is no split
+#   detail   False to store only the total rows
+Declaration = namedtuple('Declaration',
+                         ['name', 'description', 'url', 'worksheet', 'parameter', 'columns', 'exclude', 'replace',
+                          'regions', 'group', 'melt', 'total', 'category', 'split', 'dataset', 'keys', 'detail'],
+                         defaults=[None, None, None, None, (), None, None, None, None, None, None, None, True])
+
+
+@functools.lru_cache(maxsize=None)
+def _template(template):
+    return [(literal, field) for literal, field, _, _ in string.Formatter().parse(template)]
+
+
+def category(template, df):
+    """
+    Formats ``template`` (e.g. '{Measure Group-alias} : {Measure-value}')
+    for every row of ``df`` with whole-column string concatenation.
+    """
+    out = pd.Series('', index=df.index, dtype=object)
+    for literal, field in _template(template):
+        if literal:
+            out = out + literal
+        if field is not None:
+            out = out + df[field].astype(str)
+    return out
+
+
+def region_labels(values):
+    """
+    '1 - Orleans' -> 'Region 1', for a whole column at once.
+    """
+    return 'Region ' + values.str.split(' - ', n=1).str[0]
+
+
+def transform(declaration, df, date):
+    """
+    Runs a declaration's steps over a worksheet frame.
+    :returns: (dataset, frame) pairs ready for covid_la.store_day
+    """
+    d = declaration
+    df = df.rename(columns=d.columns or {})
+    for column, values in (d.exclude or {}).items():
+        df = df[~df[column].isin(values)]
+    for column, mapping in (d.replace or {}).items():
+        df = df.assign(**{column: df[column].replace(mapping)})
+    for column in d.regions:
+        df = df.assign(**{column: region_labels(df[column])})
+    if d.group:
+        keys, aggregation = d.group
+        df = df.groupby(keys, as_index=False).agg(aggregation)
+    if d.melt:
+        id_vars, value_vars = d.melt
+        df = pd.melt(df, id_vars=id_vars, value_vars=value_vars, var_name='Category', value_name='value')
+
+    frames = []
+    if d.total:
+        geography, template = d.total
+        total = df.groupby('Category', as_index=False)['value'].sum()
+        total['Category'] = category(template, total)
+        total['Geography'] = geography
+        frames.append(total)
+    if d.detail:
+        if d.category:
+            df = df.assign(Category=category(d.category, df))
+        frames.append(df)
+    df = pd.concat(frames, axis=0, ignore_index=True) if len(frames) > 1 else frames[0]
+    df = df.rename(columns={'value': date})
+
+    if d.split:
+        column, datasets = d.split
+        return [(dataset, df.loc[df[column] == value, d.keys + [date]].reset_index(drop=True))
+                for value, dataset in datasets.items()]
+    return [(d.dataset, df[d.keys + [date]])]
+
+
+declarations = {d.name: d for d in [
+    Declaration(
+        name='cases',
+        description='Parish case data by type',
+        # tabular data on total cases is in the Table: New and Previous Cases chart
+        # in the Cases by Test Date tab of Covid-19 Cases by Test Collection Date
+        url='https://analytics.la.gov/t/LDH/views/CasesChartsforDashboard/NewandPreviousCasesbyDate',
+        worksheet='Parish Cases List (2)',
+        parameter=('New and Previous Cases Chart Selection', 'Table: Cases by Type by Parish'),
+        columns={'parish-value': 'County', 'casetype-value': 'Type', 'SUM(Cases)-alias': 'value'},
+        exclude={'County': ['%all%']},
+        # Summing all parish data because on launch West Feliciana had multiple rows
+        group=(['Type', 'County'], {'value': 'sum'}),
+        split=('Type', {'%all%': 'cases_total',
+                        'Confirmed': 'cases',
+                        'Probable': 'cases_probable',
+                        'Reinfections': 'cases_reinfections'}),
+        keys=['County'],
+    ),
+    Declaration(
+        name='case_demos',
+        description='Case demographics',
+        url='https://analytics.la.gov/t/LDH/views/CasesChartsforDashboard/CasesbyAge',
+        worksheet='Cases by Age Cumulative',
+        parameter=('Select Age Range View', 'Cumulative Cases Bar Chart'),
+        columns={'Age Range-value': 'Category', 'region-alias': 'Geography', 'SUM(Cases)-value': 'value'},
+        replace={'Category': {'0-4': '0 to 4',
+                              '5-17': '5 to 17',
+                              '18-29': '18 to 29',
+                              '30-39': '30 to 39',
+                              '40-49': '40 to 49',
+                              '50-59': '50 to 59',
+                              '60-69': '60 to 69',
+                              '+70': '70+'}},
+        total=('Louisiana', '{Category}'),
+        detail=False,
+        dataset='case_demo',
+        keys=['Geography', 'Category'],
+    ),
+    Declaration(
+        name='deaths',
+        description='Parish death data by type',
+        url='https://analytics.la.gov/t/LDH/views/URLDashboardDeaths/DeathsbyParishList',
+        worksheet='Deaths by Parish and Region',
+        columns={'Parish-value': 'County', 'Measure-value': 'Type', 'SUM(Value)-alias': 'value'},
+        exclude={'County': ['%all%']},
+        split=('Type', {'Total Deaths': 'deaths_total',
+                        'Probable Deaths': 'deaths_probable',
+                        'Confirmed Deaths': 'deaths'}),
+        keys=['County'],
+    ),
+    Declaration(
+        name='vaccines',
+        description='Parish vaccine data',
+        url='https://analytics.la.gov/t/LDH/views/VaccinationDashboard2/VaccinationStatusbyAgeRaceGender2',
+        worksheet='Cumulative % Totals Demo Tables',
+        columns={'Parish-value': 'Geography',
+                 'ATTR(Completed)-alias': 'Series Completed',
+                 'ATTR(Initiated)-alias': 'Series Initiated'},
+        group=(['Geography'], {'Series Completed': 'max', 'Series Initiated': 'max'}),
+        melt=(['Geography'], ['Series Completed', 'Series Initiated']),
+        total=('State', 'Total {Category}'),
+        category='Parish - {Category}',
+        dataset='vaccines',
+        keys=['Geography', 'Category'],
+    ),
+]}
@@ -0,0 +1,181 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import functools
+import http.client
+import random
+import socket
+import threading
+import time
+from urllib.error import URLError
+import metrics
+try:
+    from requests.exceptions import RequestException
+except ImportError:
+    RequestException = None
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+retryable_exceptions = (URLError, http.client.HTTPException, ConnectionError, TimeoutError, socket.timeout)
+if RequestException is not None:
+    retryable_exceptions += (RequestException,)
+
+
+# tableauscraper reports server errors and throttling as its own exceptions
+# rather than HTTP errors. Matched by name so this module does not have to
+# import tableauscraper.
+retryable_names = {('tableauscraper.TableauScraper', 'TableauException'),
+                   ('tableauscraper.api', 'APIResponseException')}
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class EmptyResponse(Exception):
+    """
+    A request that succeeded but returned no data where there always is some,
+    such as a filtered worksheet after tableauscraper swallowed a server error.
+    """
+    pass
+
+
+def is_retryable(e):
+    """
+    Network and server failures are worth retrying; anything else (a
+    renamed field, a bad filter value, a bug) fails the same way every time.
+    """
+    if isinstance(e, CircuitOpen):
+        return False
+    if isinstance(e, retryable_exceptions + (EmptyResponse,)):
+        return True
+    return any((c.__module__, c.__name__) in retryable_names for c in type(e).__mro__)
+
+
+def backoff(attempt, base=2.0, cap=60.0):
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2**attempt
+    seconds, capped at ``cap``.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures against one host. While
+    open, calls fail immediately with CircuitOpen; after ``cooldown`` seconds
+    one trial call is let through and its outcome closes or re-opens it.
+    """
+    def __init__(self, host, threshold=3, cooldown=120):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def check(self):
+        with self.lock:
+            if self.opened is None:
+                return
+            if time.monotonic() - self.opened < self.cooldown:
+                raise CircuitOpen(f'{self.host} is failing; not retrying for {self.cooldown}s')
+            # Half-open: let this call through as the trial.
+            self.opened = time.monotonic()
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened is None:
+                    logger.error(f'Circuit opened for {self.host} after {self.failures} failures')
+                self.opened = time.monotonic()
+
+
+_breakers = {}
+_breakers_guard = threading.Lock()
+
+
+def breaker(host):
+    with _breakers_guard:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+_checkpoints = {}
+
+
+def checkpoint(name):
+    """
+    Returns the checkpoint dict for the source ``name``. Sources record
+    finished sub-steps (written categories, finished filter values) in it so
+    that a retry resumes where the failed attempt stopped. The retry
+    decorator clears it once the source finishes.
+    """
+    return _checkpoints.setdefault(name, {})
+
+
+def call(func, *args, times=5, host=None, on_failure=None, name=None, **kwargs):
+    """
+    Calls ``func`` and retries it on retryable failures with exponential
+    backoff. Failures count against the host's circuit breaker, and an open
+    breaker stops the retries at once.
+    :param times: Total number of attempts
+    :param host: Host whose circuit breaker guards the call
+    :param on_failure: Called with no arguments after every failed attempt
+    """
+    name = name or getattr(func, '__name__', repr(func))
+    for attempt in range(times):
+        if host:
+            breaker(host).check()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if host and is_retryable(e):
+                breaker(host).failure()
+            if on_failure:
+                on_failure()
+            if not is_retryable(e) or attempt == times - 1:
+                raise
+            delay = backoff(attempt)
+            metrics.count('retries', name)
+            logger.error(f'Exception thrown when attempting to run {name}, attempt {attempt + 1} of {times} '
+                         f'({e!r}); retrying in {delay:.1f}s')
+            time.sleep(delay)
+            continue
+        if host:
+            breaker(host).success()
+        return result
+
+
+def retry(times, host=None, on_failure=None):
+    """
+    Retry Decorator
+    Retries the wrapped function/method up to `times` attempts on retryable
+    failures, with backoff and a per-host circuit breaker, and clears the
+    function's checkpoint once it finishes
+    :param times: The number of attempts
+    :type times: Int
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def newfn(*args, **kwargs):
+            try:
+                return call(func, *args, times=times, host=host, on_failure=on_failure, **kwargs)
+            finally:
+                _checkpoints.pop(func.__name__, None)
+        return newfn
+    return decorator
@@ -0,0 +1,135 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import subprocess
+from io import StringIO
+import pandas as pd
+import store
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Bitemporal log of restated series in the same SQLite file as the
+# time-series store. A row is written only when a cell's value differs from
+# what the previous vintage said; a NULL value marks a cell a vintage dropped.
+schema = """
+CREATE TABLE IF NOT EXISTS revisions (
+    dataset TEXT NOT NULL,
+    series TEXT NOT NULL,
+    ref_date TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (dataset, series, ref_date, report_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS revisions_report ON revisions (dataset, report_date);
+CREATE INDEX IF NOT EXISTS revisions_ref ON revisions (dataset, ref_date, report_date);
+"""
+
+
+def connect(path=None):
+    conn = store.connect(path)
+    conn.executescript(schema)
+    return conn
+
+
+def _long(df):
+    """
+    Melts a wide vintage (identifier columns + one column per reference
+    date) into (series, ref_date, value), joining the identifiers with ' - '.
+    """
+    id_columns, date_columns = store.split_columns(df)
+    series = df[id_columns].astype(str).agg(' - '.join, axis=1)
+    values = df[date_columns].apply(pd.to_numeric, errors='coerce')
+    values.columns = [store.iso_date(c) for c in date_columns]
+    values.insert(0, 'series', series.values)
+    return values.melt(id_vars='series', var_name='ref_date', value_name='value')
+
+
+def _as_of(conn, dataset, report_date, inclusive=True):
+    return pd.read_sql_query(
+        'SELECT series, ref_date, value, MAX(report_date) AS report_date FROM revisions '
+        f"WHERE dataset = ? AND report_date {'<=' if inclusive else '<'} ? GROUP BY series, ref_date",
+        conn, params=[dataset, report_date]
+    )
+
+
+def record(dataset, df, report_date, path=None):
+    """
+    Logs the vintage of ``dataset`` published on ``report_date``, storing
+    only the cells that differ from the vintage in effect before that date.
+    Recording the same date again replaces that date's vintage. Vintages are
+    expected to be recorded in report-date order.
+    :param df: The wide frame as written to data/
+    :returns: The number of changed cells recorded
+    """
+    report_date = store.iso_date(report_date)
+    new = _long(df)
+    with store.write_lock:
+        conn = connect(path)
+        try:
+            with conn:
+                old = _as_of(conn, dataset, report_date, inclusive=False)
+                merged = new.merge(old[['series', 'ref_date', 'value']], on=['series', 'ref_date'],
+                                   how='outer', suffixes=('', '_old'))
+                same = (merged['value'] == merged['value_old']) | (merged['value'].isnull() & merged['value_old'].isnull())
+                changed = merged[~same]
+                conn.execute('DELETE FROM revisions WHERE dataset = ? AND report_date = ?', (dataset, report_date))
+                conn.executemany(
+                    'INSERT INTO revisions VALUES (?, ?, ?, ?, ?)',
+                    [(dataset, s, r, report_date, None if pd.isnull(v) else float(v))
+                     for s, r, v in changed[['series', 'ref_date', 'value']].itertuples(index=False, name=None)]
+                )
+        finally:
+            conn.close()
+    logger.info(f'Recorded {len(changed)} revised cells for {dataset} as of {report_date}.')
+    return len(changed)
+
+
+def as_of(dataset, report_date, path=None):
+    """
+    The series as it was published on ``report_date``, in long form
+    (series, ref_date, value, report_date of the value's last revision).
+    """
+    conn = connect(path)
+    try:
+        df = _as_of(conn, dataset, store.iso_date(report_date))
+    finally:
+        conn.close()
+    return df.dropna(subset=['value']).reset_index(drop=True)
+
+
+def history(dataset, ref_date, series=None, path=None):
+    """
+    Every revision of the values for one reference date, in report order.
+    """
+    query = 'SELECT series, report_date, value FROM revisions WHERE dataset = ? AND ref_date = ?'
+    params = [dataset, store.iso_date(ref_date)]
+    if series is not None:
+        query += ' AND series = ?'
+        params.append(series)
+    conn = connect(path)
+    try:
+        return pd.read_sql_query(query + ' ORDER BY series, report_date', conn, params=params)
+    finally:
+        conn.close()
+
+
+def backfill_from_git(dataset, file, path=None):
+    """
+    Seeds the log from the committed history of ``file`` (relative to the
+    repository root), one vintage per commit date, oldest first. Only needed
+    once per dataset; later vintages are recorded as they are scraped.
+    """
+    log = subprocess.run(['git', 'log', '--reverse', '--format=%H %cs', '--', file],
+                         cwd=module_path, capture_output=True, text=True, check=True).stdout.split('\n')
+    vintages = dict(line.split(' ')[::-1] for line in log if line)
+    for report_date, commit in vintages.items():
+        contents = subprocess.run(['git', 'show', f'{commit}:{file}'], cwd=module_path,
+                                  capture_output=True, text=True, check=True).stdout
+        record(dataset, pd.read_csv(StringIO(contents)), report_date, path)
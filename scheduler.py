@@ -0,0 +1,91 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import metrics
+import resilience
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+max_workers = int(os.environ.get('COVID_LA_MAX_WORKERS', 4))
+filter_workers = int(os.environ.get('COVID_LA_FILTER_WORKERS', 4))
+
+SourceResult = namedtuple('SourceResult', ['name', 'ok', 'seconds', 'error'])
+
+_file_locks = defaultdict(threading.Lock)
+_file_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an in-process lock for one output file so two sources running on
+    the pool never write the same file in data/ at the same time.
+    """
+    with _file_locks_guard:
+        lock = _file_locks[os.path.abspath(path)]
+    with lock:
+        yield
+
+
+def _timed(source):
+    start = time.perf_counter()
+    try:
+        with metrics.stage('source', source.__name__):
+            source()
+    except Exception as e:
+        logger.exception(f'FAILED: {source.__name__}')
+        return SourceResult(source.__name__, False, time.perf_counter() - start, e)
+    return SourceResult(source.__name__, True, time.perf_counter() - start, None)
+
+
+def run_sources(sources, workers=None):
+    """
+    Runs independent source functions concurrently on a bounded thread pool.
+    A failing source is logged and reported but never stops the others.
+    :param sources: Source functions taking no arguments
+    :param workers: Maximum number of sources in flight (default max_workers)
+    :returns: A SourceResult per source, in the order given
+    """
+    workers = workers or max_workers
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='source') as pool:
+        results = list(pool.map(_timed, sources))
+    for r in results:
+        if r.ok:
+            logger.info(f'SOURCE OK: {r.name} in {r.seconds:.1f}s')
+        else:
+            logger.error(f'SOURCE FAILED: {r.name} after {r.seconds:.1f}s ({r.error!r})')
+    return results
+
+
+def fan_out(task, values, workers=None, attempts=3):
+    """
+    Runs ``task(value)`` for every value on a bounded thread pool and gathers
+    the results in the order of ``values``, so callers can combine them
+    exactly as a serial loop would. A failing value is retried on its own,
+    with backoff up to ``attempts`` times, without repeating the values that
+    succeeded.
+    :param task: Function of a single filter value
+    :param values: Filter values to sweep
+    :param workers: Maximum concurrent tasks (default filter_workers)
+    """
+    def attempt(value):
+        return resilience.call(task, value, times=attempts, name=f'filter value {value!r}')
+
+    values = list(values)
+    workers = workers or filter_workers
+    if workers <= 1:
+        return [attempt(v) for v in values]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='filter') as pool:
+        return list(pool.map(attempt, values))
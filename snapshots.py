@@ -0,0 +1,170 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import bisect
+import gzip
+import hashlib
+import io
+import json
+import re
+import threading
+from collections import defaultdict
+import pandas as pd
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+snapshot_path = f'{module_path}/data/snapshots'
+full_datasets_path = f'{module_path}/data/full_datasets'
+
+# Longest chain of deltas before a whole snapshot is stored again, bounding
+# how many objects a read has to apply.
+max_chain = 30
+
+file_pattern = re.compile(r'^(?P<dataset>.+?)(?P<date>\d{4}-\d{2}-\d{2})\.csv$')
+
+_locks = defaultdict(threading.Lock)
+
+
+def _object_file(digest, root):
+    return f'{root}/objects/{digest[:2]}/{digest}.gz'
+
+
+def _index_file(dataset, root):
+    return f'{root}/index/{dataset}.json'
+
+
+def _write(path, data, binary=True):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb' if binary else 'w') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def load_index(dataset, root=None):
+    path = _index_file(dataset, root or snapshot_path)
+    if not os.path.exists(path):
+        return {'dates': [], 'hashes': [], 'objects': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def datasets(root=None):
+    root = root or snapshot_path
+    if not os.path.isdir(f'{root}/index'):
+        return []
+    return sorted(f[:-len('.json')] for f in os.listdir(f'{root}/index') if f.endswith('.json'))
+
+
+def dates(dataset, root=None):
+    return load_index(dataset, root)['dates']
+
+
+def _load_object(digest, index, root):
+    with gzip.open(_object_file(digest, root), 'rb') as f:
+        data = f.read()
+    entry = index['objects'][digest]
+    if entry['base'] is None:
+        return data
+    delta = json.loads(data)
+    lines = _load_object(entry['base'], index, root).splitlines(keepends=True)[:delta['length']]
+    lines += [b''] * (delta['length'] - len(lines))
+    for position, line in delta['lines'].items():
+        lines[int(position)] = line.encode(errors='surrogateescape')
+    return b''.join(lines)
+
+
+def _delta(previous, current):
+    """
+    Positional line delta: the lines of ``current`` that differ from the line
+    at the same position in ``previous``. ArcGIS layers keep their row order
+    between days, so edits show up as a handful of changed positions.
+    """
+    old = previous.splitlines(keepends=True)
+    new = current.splitlines(keepends=True)
+    changed = {i: line.decode(errors='surrogateescape') for i, line in enumerate(new) if i >= len(old) or old[i] != line}
+    return {'length': len(new), 'lines': changed}, len(changed) / max(len(new), 1)
+
+
+def add(dataset, date, data, root=None):
+    """
+    Adds the snapshot of ``dataset`` for ``date`` ('YYYY-MM-DD'). Identical
+    content is stored once and only referenced by later dates. Otherwise the
+    snapshot is stored as the lines that changed relative to the latest
+    earlier snapshot, or compressed whole when most of it changed.
+    :param data: CSV contents as bytes, or a path to a CSV file
+    :returns: The sha256 of the snapshot contents
+    """
+    root = root or snapshot_path
+    if isinstance(data, str):
+        with open(data, 'rb') as f:
+            data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    with _locks[dataset]:
+        index = load_index(dataset, root)
+        if digest not in index['objects']:
+            position = bisect.bisect_left(index['dates'], date)
+            base = index['hashes'][position - 1] if position > 0 else None
+            entry = {'base': None, 'depth': 0}
+            payload = data
+            if base is not None and index['objects'][base]['depth'] < max_chain:
+                delta, ratio = _delta(_load_object(base, index, root), data)
+                if ratio < 0.5:
+                    entry = {'base': base, 'depth': index['objects'][base]['depth'] + 1}
+                    payload = json.dumps(delta).encode()
+            _write(_object_file(digest, root), gzip.compress(payload))
+            index['objects'][digest] = entry
+        if date in index['dates']:
+            index['hashes'][index['dates'].index(date)] = digest
+        else:
+            position = bisect.bisect_left(index['dates'], date)
+            index['dates'].insert(position, date)
+            index['hashes'].insert(position, digest)
+        _write(_index_file(dataset, root), json.dumps(index), binary=False)
+    return digest
+
+
+def materialize(dataset, date, root=None):
+    """
+    Returns the CSV bytes of ``dataset`` as of ``date``: the latest snapshot
+    taken on or before that date. Only the snapshot's own delta chain is
+    read, never the whole history.
+    """
+    root = root or snapshot_path
+    index = load_index(dataset, root)
+    position = bisect.bisect_right(index['dates'], str(date)[:10])
+    if position == 0:
+        raise KeyError(f'No snapshot of {dataset} on or before {date}')
+    return _load_object(index['hashes'][position - 1], index, root)
+
+
+def read(dataset, date, root=None):
+    return pd.read_csv(io.BytesIO(materialize(dataset, date, root)), index_col=0)
+
+
+def import_directory(directory=None, root=None, remove=False):
+    """
+    Moves daily '{dataset}{YYYY-MM-DD}.csv' files into the snapshot store in
+    date order. With ``remove`` a file is deleted once the store has been
+    verified to reproduce it byte for byte.
+    """
+    directory = directory or full_datasets_path
+    matches = [(m.group('date'), m.group('dataset'), name)
+               for name in os.listdir(directory) for m in [file_pattern.match(name)] if m]
+    for date, dataset, name in sorted(matches):
+        path = f'{directory}/{name}'
+        digest = add(dataset, date, path, root)
+        if remove and hashlib.sha256(materialize(dataset, date, root)).hexdigest() == digest:
+            os.remove(path)
+    logger.info(f'Imported {len(matches)} snapshots from {directory}.')
+
+
+if __name__ == "__main__":
+    import_directory(remove='--remove' in sys.argv)
@@ -0,0 +1,228 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import hashlib
+import json
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Commit journals: each lists the staged temp files of one batch and the
+# files they replace, written before the first rename and removed after the
+# last, so an interrupted commit can be rolled forward. The committing process
+# holds a lock on its journal, so a journal that can be locked is abandoned.
+journal_path = f'{module_path}/data/.commits'
+
+# Seconds after which an empty journal is taken to be abandoned.
+abandoned_after = 60
+
+_current = threading.local()
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def unchanged(path, data):
+    """
+    Whether ``path`` already holds exactly ``data``. Sizes are compared
+    first so most changed files are never read back.
+    """
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return digest(f.read()) == digest(data)
+    except FileNotFoundError:
+        return False
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Batch:
+    """
+    Output files staged as temp files next to their targets and committed
+    together: a journal is written, every temp file is renamed over its
+    target, and the journal is removed. Files whose contents would not
+    change are never staged.
+    """
+    def __init__(self, journal=None):
+        self.journal = journal or journal_path
+        self.staged = {}
+        self.skipped = []
+
+    def write(self, path, data):
+        path = os.path.abspath(path)
+        if isinstance(data, str):
+            data = data.encode()
+        if unchanged(path, data):
+            self.discard(path)
+            self.skipped.append(path)
+            metrics.count('writes_skipped', os.path.basename(path))
+            return False
+        directory, name = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644
+        os.chmod(tmp, mode)
+        self.discard(path)
+        self.staged[path] = tmp
+        return True
+
+    def csv(self, path, df, **kwargs):
+        return self.write(path, df.to_csv(**kwargs))
+
+    def discard(self, path):
+        tmp = self.staged.pop(path, None)
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+    def commit(self):
+        if not self.staged:
+            return
+        os.makedirs(self.journal, exist_ok=True)
+        journal = f'{self.journal}/{os.getpid()}-{threading.get_ident()}-{id(self)}.json'
+        with open(journal, 'x') as f:
+            _lock(f)
+            json.dump({'files': [[tmp, path] for path, tmp in self.staged.items()]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+            for path, tmp in self.staged.items():
+                os.replace(tmp, path)
+            for directory in {os.path.dirname(p) for p in self.staged}:
+                _fsync_directory(directory)
+        # Closing released the lock; recover() may already have removed it.
+        try:
+            os.remove(journal)
+        except FileNotFoundError:
+            pass
+        logger.info(f'Committed {len(self.staged)} files ({len(self.skipped)} unchanged).')
+        self.staged.clear()
+
+    def abort(self):
+        for path in list(self.staged):
+            self.discard(path)
+
+
+def _lock(f, wait=True):
+    """
+    Takes an exclusive lock on the open file ``f``, held until it is closed.
+    :returns: False if ``wait`` is off and another open handle holds the lock
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if wait else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if wait:
+            raise
+        return False
+    return True
+
+
+def recover(journal=None):
+    """
+    Finishes commits interrupted by a crash: every staged file listed in a
+    journal no process holds locked that is still on disk is renamed into
+    place.
+    """
+    journal = journal or journal_path
+    if not os.path.isdir(journal):
+        return
+    for name in os.listdir(journal):
+        if not name.endswith('.json'):
+            continue
+        file = f'{journal}/{name}'
+        try:
+            f = open(file, 'r+')
+        except FileNotFoundError:
+            continue
+        with f:
+            if not _lock(f, wait=False):
+                continue
+            f.seek(0)
+            try:
+                entry = json.load(f)
+            except ValueError:
+                # Created but not yet written: either its owner is about to
+                # lock it or it died before renaming anything.
+                if time.time() - os.path.getmtime(file) < abandoned_after:
+                    continue
+                entry = {'files': []}
+            for tmp, path in entry['files']:
+                if os.path.exists(tmp):
+                    os.replace(tmp, path)
+                    logger.warning(f'Recovered interrupted write of {path}')
+        os.remove(file)
+
+
+@contextmanager
+def batch(journal=None):
+    """
+    Collects every write_csv/write in the block, in this thread, into one
+    batch that is committed when the block succeeds and discarded if it
+    raises. Nested blocks join the outer batch.
+    """
+    outer = getattr(_current, 'batch', None)
+    if outer is not None:
+        yield outer
+        return
+    recover(journal)
+    _current.batch = Batch(journal)
+    try:
+        yield _current.batch
+        _current.batch.commit()
+    except BaseException:
+        _current.batch.abort()
+        raise
+    finally:
+        _current.batch = None
+
+
+def write(path, data):
+    with batch() as b:
+        return b.write(path, data)
+
+
+def write_csv(df, path, **kwargs):
+    """
+    Writes ``df.to_csv(**kwargs)`` to ``path`` atomically, as part of the
+    current batch if there is one, and skips the write if the file already
+    has exactly that content.
+    """
+    with batch() as b:
+        return b.csv(path, df, **kwargs)
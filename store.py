@@ -0,0 +1,305 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import json
+import sqlite3
+import threading
+import time
+import pandas as pd
+import staging
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+store_path = f'{module_path}/data/timeseries.sqlite'
+
+# SQLite allows a single writer at a time; serialize writers from this process
+# so concurrent sources wait on the lock instead of on "database is locked".
+write_lock = threading.Lock()
+
+schema = """
+CREATE TABLE IF NOT EXISTS datasets (
+    name TEXT PRIMARY KEY,
+    id_columns TEXT NOT NULL,
+    modified REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    geography TEXT,
+    category TEXT,
+    labels TEXT NOT NULL,
+    UNIQUE (dataset, labels)
+);
+CREATE INDEX IF NOT EXISTS series_lookup ON series (dataset, geography, category);
+CREATE TABLE IF NOT EXISTS dates (
+    dataset TEXT NOT NULL,
+    date TEXT NOT NULL,
+    label TEXT NOT NULL,
+    integral INTEGER,
+    PRIMARY KEY (dataset, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS observations (
+    series INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (series, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS observations_date ON observations (date, series);
+"""
+
+
+def connect(path=None):
+    conn = sqlite3.connect(path or store_path, timeout=60)
+    conn.executescript(schema)
+    if 'integral' not in [row[1] for row in conn.execute('PRAGMA table_info(dates)')]:
+        # Stores created before dates recorded how their CSV column was written.
+        conn.execute('ALTER TABLE dates ADD COLUMN integral INTEGER')
+    return conn
+
+
+def written_as_integers(text):
+    """
+    Whether a CSV column, read as strings, holds only whole numbers written
+    without a decimal point (blank cells aside).
+    """
+    return bool(text.dropna().str.fullmatch(r'\s*-?\d+\s*').all())
+
+
+def iso_date(label):
+    """
+    Normalizes a date column label such as '3/9/2020', '03/24/2020' or
+    '2020-03-04 00:00:00' to 'YYYY-MM-DD'. Returns None for labels that are
+    not dates (identifier columns).
+    """
+    parsed = pd.to_datetime(str(label), errors='coerce')
+    if pd.isnull(parsed):
+        return None
+    return parsed.strftime('%Y-%m-%d')
+
+
+def split_columns(df):
+    id_columns = [c for c in df.columns if iso_date(c) is None]
+    date_columns = [c for c in df.columns if c not in id_columns]
+    return id_columns, date_columns
+
+
+def label_key(values):
+    return json.dumps([None if pd.isnull(v) else str(v) for v in values])
+
+
+def series_axes(id_columns, on):
+    on = [on] if isinstance(on, str) else list(on)
+    geography = next((c for c in on if c != 'Category'), None)
+    category = 'Category' if 'Category' in id_columns else None
+    return geography, category
+
+
+def exists(dataset, path=None):
+    conn = connect(path)
+    try:
+        row = conn.execute('SELECT 1 FROM datasets WHERE name = ?', (dataset,)).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def modified(dataset, path=None):
+    conn = connect(path)
+    try:
+        row = conn.execute('SELECT modified FROM datasets WHERE name = ?', (dataset,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def _touch(conn, dataset, id_columns):
+    conn.execute(
+        'INSERT INTO datasets (name, id_columns, modified) VALUES (?, ?, ?) '
+        'ON CONFLICT (name) DO UPDATE SET modified = excluded.modified',
+        (dataset, json.dumps(id_columns), time.time())
+    )
+
+
+def _series_ids(conn, dataset, id_columns, on, frame):
+    """
+    Maps every row of ``frame`` onto a series id, matching existing series on
+    the ``on`` columns the same way the old outer merge did and creating new
+    series (with blank values for the other identifier columns) as needed.
+    """
+    on = [on] if isinstance(on, str) else list(on)
+    geography, category = series_axes(id_columns, on)
+    positions = [id_columns.index(c) for c in on]
+    known = {}
+    for series_id, labels in conn.execute('SELECT id, labels FROM series WHERE dataset = ?', (dataset,)):
+        values = json.loads(labels)
+        known.setdefault(tuple(values[p] for p in positions), series_id)
+    ids = []
+    for values in frame[on].itertuples(index=False, name=None):
+        key = tuple(json.loads(label_key(values)))
+        if key not in known:
+            full = [None] * len(id_columns)
+            for p, v in zip(positions, key):
+                full[p] = v
+            record = dict(zip(id_columns, full))
+            cursor = conn.execute(
+                'INSERT INTO series (dataset, geography, category, labels) VALUES (?, ?, ?, ?)',
+                (dataset, record.get(geography), record.get(category), json.dumps(full))
+            )
+            known[key] = cursor.lastrowid
+        ids.append(known[key])
+    return ids
+
+
+def import_wide(dataset, file, on, path=None):
+    """
+    Seeds the store from an existing wide CSV (one column per day). Rows keep
+    their file order, so an export reproduces the original row layout.
+    """
+    df = pd.read_csv(file, dtype={'FIPS': object})
+    id_columns, date_columns = split_columns(df)
+    text = pd.read_csv(file, dtype=str, usecols=date_columns)
+    geography, category = series_axes(id_columns, on)
+    with write_lock:
+        conn = connect(path)
+        try:
+            with conn:
+                _touch(conn, dataset, id_columns)
+                ids = []
+                for values in df[id_columns].itertuples(index=False, name=None):
+                    labels = label_key(values)
+                    record = dict(zip(id_columns, json.loads(labels)))
+                    conn.execute(
+                        'INSERT OR IGNORE INTO series (dataset, geography, category, labels) VALUES (?, ?, ?, ?)',
+                        (dataset, record.get(geography), record.get(category), labels)
+                    )
+                    ids.append(conn.execute(
+                        'SELECT id FROM series WHERE dataset = ? AND labels = ?', (dataset, labels)
+                    ).fetchone()[0])
+                for column in date_columns:
+                    date = iso_date(column)
+                    conn.execute('INSERT OR REPLACE INTO dates VALUES (?, ?, ?, ?)',
+                                 (dataset, date, column, int(written_as_integers(text[column]))))
+                    values = pd.to_numeric(df[column], errors='coerce')
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO observations VALUES (?, ?, ?)',
+                        [(i, date, float(v)) for i, v in zip(ids, values) if not pd.isnull(v)]
+                    )
+        finally:
+            conn.close()
+    logger.info(f'Imported {dataset} into the time-series store: {len(df)} rows, {len(date_columns)} dates.')
+
+
+def ensure(dataset, file, on, path=None):
+    if not exists(dataset, path) and os.path.exists(file):
+        import_wide(dataset, file, on, path)
+
+
+def append(dataset, df, on, date_label, path=None):
+    """
+    Stores one day of data for ``dataset``. ``df`` holds the ``on`` key
+    columns plus a ``date_label`` value column, as the sources build it.
+    Re-running a day replaces that day's values, so the cost is proportional
+    to the rows of the day rather than to the length of the series.
+    """
+    append_days(dataset, df, on, [date_label], path)
+
+
+def append_days(dataset, df, on, date_labels, path=None, replace='day'):
+    """
+    Stores several days at once: ``df`` holds the ``on`` key columns plus one
+    value column per label in ``date_labels``, written in one transaction.
+    :param replace: 'day' replaces every value stored for those dates, as
+        append does; 'series' only the values of the series in ``df``;
+        'missing' keeps every stored value and only fills gaps
+    """
+    on = [on] if isinstance(on, str) else list(on)
+    with write_lock:
+        conn = connect(path)
+        try:
+            with conn:
+                row = conn.execute('SELECT id_columns FROM datasets WHERE name = ?', (dataset,)).fetchone()
+                id_columns = json.loads(row[0]) if row else on
+                _touch(conn, dataset, id_columns)
+                ids = _series_ids(conn, dataset, id_columns, on, df)
+                verb = 'INSERT OR IGNORE' if replace == 'missing' else 'INSERT OR REPLACE'
+                for date_label in date_labels:
+                    date = iso_date(date_label)
+                    if replace == 'day':
+                        conn.execute(
+                            'DELETE FROM observations WHERE date = ? AND series IN '
+                            '(SELECT id FROM series WHERE dataset = ?)',
+                            (date, dataset)
+                        )
+                    elif replace == 'series':
+                        conn.executemany('DELETE FROM observations WHERE series = ? AND date = ?',
+                                         [(i, date) for i in set(ids)])
+                    conn.execute(f'{verb} INTO dates VALUES (?, ?, ?, NULL)', (dataset, date, date_label))
+                    values = pd.to_numeric(df[date_label], errors='coerce')
+                    conn.executemany(
+                        f'{verb} INTO observations VALUES (?, ?, ?)',
+                        [(i, date, float(v)) for i, v in zip(ids, values) if not pd.isnull(v)]
+                    )
+        finally:
+            conn.close()
+
+
+def load(dataset, geography=None, category=None, start=None, end=None, path=None):
+    """
+    Returns the long (geography, category, date, value) rows of a dataset,
+    optionally narrowed to one geography, category and/or date range. Only the
+    matching rows are read.
+    """
+    query = ('SELECT s.geography, s.category, o.date, o.value FROM series s '
+             'JOIN observations o ON o.series = s.id WHERE s.dataset = ?')
+    params = [dataset]
+    for clause, value in [('s.geography = ?', geography), ('s.category = ?', category),
+                          ('o.date >= ?', start and iso_date(start)), ('o.date <= ?', end and iso_date(end))]:
+        if value is not None:
+            query += f' AND {clause}'
+            params.append(value)
+    conn = connect(path)
+    try:
+        df = pd.read_sql_query(query + ' ORDER BY s.id, o.date', conn, params=params)
+    finally:
+        conn.close()
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def wide(dataset, path=None):
+    """
+    Rebuilds the wide one-column-per-day table for a dataset in its original
+    row order, with date columns in chronological order.
+    """
+    conn = connect(path)
+    try:
+        id_columns = json.loads(conn.execute('SELECT id_columns FROM datasets WHERE name = ?', (dataset,)).fetchone()[0])
+        series = pd.read_sql_query('SELECT id, labels FROM series WHERE dataset = ? ORDER BY id', conn, params=[dataset])
+        dates = pd.read_sql_query('SELECT date, label, integral FROM dates WHERE dataset = ? ORDER BY date', conn,
+                                  params=[dataset])
+        obs = pd.read_sql_query(
+            'SELECT o.series, o.date, o.value FROM observations o JOIN series s ON o.series = s.id WHERE s.dataset = ?',
+            conn, params=[dataset]
+        )
+    finally:
+        conn.close()
+    labels = pd.DataFrame([json.loads(l) for l in series['labels']], columns=id_columns, index=series['id'])
+    values = obs.pivot(index='series', columns='date', values='value').reindex(index=series['id'], columns=dates['date'])
+    # Whole-number columns are written as integers, with blanks for gaps, unless
+    # the CSV they were imported from wrote them as floats.
+    whole = ((values % 1 == 0) | values.isnull()).all() & (dates['integral'] != 0).to_numpy()
+    values = values.astype({c: 'Int64' for c in values.columns[whole]})
+    values.columns = dates['label'].tolist()
+    return pd.concat([labels, values], axis=1).reset_index(drop=True)
+
+
+def export(dataset, file, path=None):
+    if staging.write_csv(wide(dataset, path), file, index=False):
+        logger.info(f'Exported {dataset} to {file}.')
@@ -0,0 +1,44 @@
+import pandas as pd
+import arcgis
+import fixtures
+
+
+def test_download_fetches_every_page(tmp_path):
+    file = tmp_path / 'layer.csv'
+    with fixtures.stand_in(rows=5000, page_size=1000):
+        report = arcgis.download('Synthetic', str(file), workers=3)
+    assert (report.rows, report.pages, report.failed_pages, report.error) == (5000, 5, [], None)
+    df = pd.read_csv(file, index_col=0)
+    assert df['OBJECTID'].tolist() == list(range(1, 5001))
+
+
+def test_short_pages_are_failed_and_never_published(tmp_path):
+    file = tmp_path / 'layer.csv'
+    file.write_text('previous download\n')
+    with fixtures.stand_in(rows=5000, page_size=1000, max_record_count=2000):
+        report = arcgis.download('Synthetic', str(file), workers=3)
+    assert report.failed_pages == [0, 2000]
+    assert file.read_text() == 'previous download\n'
+    assert not (tmp_path / 'layer.csv.part').exists()
+
+
+def test_empty_layer(tmp_path):
+    file = tmp_path / 'layer.csv'
+    with fixtures.stand_in(rows=0):
+        report = arcgis.download('Synthetic', str(file))
+    assert (report.rows, report.failed_pages, report.error) == (0, [], None)
+    assert file.exists()
+
+
+def test_incomplete_download_is_not_recorded_in_the_manifest(tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    with fixtures.stand_in(rows=3000, page_size=1000, max_record_count=2000):
+        [report] = arcgis.download_all(['Synthetic'], str(tmp_path), '2021-01-01', manifest_path=str(manifest))
+    assert report.failed_pages
+    assert arcgis.load_manifest(str(manifest)) == {}
+    with fixtures.stand_in(rows=3000, page_size=1000):
+        [report] = arcgis.download_all(['Synthetic'], str(tmp_path), '2021-01-01', manifest_path=str(manifest))
+        assert report.rows == 3000 and report.pages == 3
+        [again] = arcgis.download_all(['Synthetic'], str(tmp_path), '2021-01-01', manifest_path=str(manifest))
+    assert again.pages == 0
+    assert arcgis.load_manifest(str(manifest))['Synthetic']['file'] == 'Synthetic2021-01-01.csv'
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+import download_data
+import fixtures
+
+
+@pytest.fixture
+def bounded(monkeypatch):
+    """
+    Fails a download that fetches more than ``rows`` rows instead of letting
+    offsets that never advance page forever.
+    """
+    pages = download_data.pages
+
+    def bound(rows):
+        def bounded_pages(dataset):
+            fetched = 0
+            for df in pages(dataset):
+                fetched += len(df)
+                assert fetched <= rows, f'fetched {fetched} rows of a {rows}-row layer'
+                yield df
+        monkeypatch.setattr(download_data, 'pages', bounded_pages)
+    return bound
+
+
+@pytest.mark.parametrize('rows, page_size', [(7000, 2000), (2500, 1000), (1000, 1000)])
+def test_pages_advance_through_every_row(bounded, rows, page_size):
+    bounded(rows)
+    with fixtures.stand_in(rows=rows, page_size=page_size):
+        df = download_data.download('Synthetic')
+    assert df['OBJECTID'].tolist() == list(range(1, rows + 1))
+
+
+def test_download_streams_every_page_to_the_file(bounded, tmp_path):
+    bounded(4500)
+    file = tmp_path / 'layer.csv'
+    with fixtures.stand_in(rows=4500, page_size=1000):
+        assert download_data.download('Synthetic', str(file)) == 4500
+    df = pd.read_csv(file, index_col=0)
+    assert df['OBJECTID'].tolist() == list(range(1, 4501))
+    assert df.index.tolist() == list(range(4500))
+    assert not (tmp_path / 'layer.csv.part').exists()
+
+
+def test_empty_layer(tmp_path):
+    file = tmp_path / 'layer.csv'
+    with fixtures.stand_in(rows=0):
+        assert download_data.download('Synthetic').empty
+        assert download_data.download('Synthetic', str(file)) == 0
+    assert file.exists()
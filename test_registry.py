@@ -0,0 +1,75 @@
+import pandas as pd
+import registry
+
+
+def test_category_formats_every_row():
+    df = pd.DataFrame({'Measure Group-alias': ['Race', 'Age'], 'Measure-value': ['White', '18 to 29']})
+    assert registry.category('{Measure Group-alias} : {Measure-value}', df).tolist() == ['Race : White', 'Age : 18 to 29']
+
+
+def test_region_labels():
+    assert registry.region_labels(pd.Series(['1 - Orleans', '9 - Hammond'])).tolist() == ['Region 1', 'Region 9']
+
+
+def test_cases_split_by_type():
+    df = pd.DataFrame({
+        'parish-value': ['Acadia', 'Acadia', 'Acadia', 'Allen', '%all%'],
+        'casetype-value': ['Confirmed', 'Confirmed', 'Probable', 'Confirmed', 'Confirmed'],
+        'SUM(Cases)-alias': [1, 2, 5, 4, 100],
+    })
+    out = dict(registry.transform(registry.declarations['cases'], df, '3/9/2020'))
+    assert out['cases'].values.tolist() == [['Acadia', 3], ['Allen', 4]]
+    assert out['cases_probable'].values.tolist() == [['Acadia', 5]]
+    assert out['cases_total'].empty
+    assert list(out['cases'].columns) == ['County', '3/9/2020']
+
+
+def test_case_demos_store_only_the_total():
+    df = pd.DataFrame({
+        'Age Range-value': ['0-4', '0-4', '+70'],
+        'region-alias': ['Region 1', 'Region 2', 'Region 1'],
+        'SUM(Cases)-value': [1, 2, 3],
+    })
+    [(dataset, frame)] = registry.transform(registry.declarations['case_demos'], df, '3/9/2020')
+    assert dataset == 'case_demo'
+    assert frame.values.tolist() == [['Louisiana', '0 to 4', 3], ['Louisiana', '70+', 3]]
+
+
+def test_vaccines_melt_with_state_totals():
+    df = pd.DataFrame({
+        'Parish-value': ['Acadia', 'Acadia', 'Allen'],
+        'ATTR(Completed)-alias': [10, 12, 5],
+        'ATTR(Initiated)-alias': [20, 15, 7],
+    })
+    [(dataset, frame)] = registry.transform(registry.declarations['vaccines'], df, '3/9/2020')
+    assert dataset == 'vaccines'
+    assert frame.values.tolist() == [
+        ['State', 'Total Series Completed', 17],
+        ['State', 'Total Series Initiated', 27],
+        ['Acadia', 'Parish - Series Completed', 12],
+        ['Allen', 'Parish - Series Completed', 5],
+        ['Acadia', 'Parish - Series Initiated', 20],
+        ['Allen', 'Parish - Series Initiated', 7],
+    ]
+
+
+def test_deaths_split_by_measure():
+    df = pd.DataFrame({
+        'Parish-value': ['Acadia', 'Acadia', 'Acadia', '%all%'],
+        'Measure-value': ['Confirmed Deaths', 'Probable Deaths', 'Total Deaths', 'Total Deaths'],
+        'SUM(Value)-alias': [3, 1, 4, 90],
+    })
+    out = dict(registry.transform(registry.declarations['deaths'], df, '3/9/2020'))
+    assert {name: frame.values.tolist() for name, frame in out.items()} == {
+        'deaths': [['Acadia', 3]], 'deaths_probable': [['Acadia', 1]], 'deaths_total': [['Acadia', 4]]}
+
+
+def test_regions_are_relabelled_before_grouping():
+    declaration = registry.Declaration(
+        name='capacity', description='', url=None, worksheet=None,
+        columns={'LDH Region-value': 'LDH Region', 'Beds-alias': 'value'},
+        regions=('LDH Region',), group=(['LDH Region'], {'value': 'sum'}), category='Beds',
+        dataset='capacity', keys=['LDH Region', 'Category'])
+    df = pd.DataFrame({'LDH Region-value': ['1 - Orleans', '1 - Orleans', '9 - Hammond'], 'Beds-alias': [2, 3, 4]})
+    [(dataset, frame)] = registry.transform(declaration, df, '3/9/2020')
+    assert frame.values.tolist() == [['Region 1', 'Beds', 5], ['Region 9', 'Beds', 4]]
@@ -0,0 +1,105 @@
+from urllib.error import URLError
+import pytest
+import resilience
+
+backoff = resilience.backoff
+
+
+@pytest.fixture(autouse=True)
+def no_waiting(monkeypatch):
+    monkeypatch.setattr(resilience, 'backoff', lambda attempt: 0)
+    monkeypatch.setattr(resilience, '_breakers', {})
+
+
+def flaky(failures, error=URLError):
+    """
+    A function that raises ``error`` on its first ``failures`` calls and
+    then returns the number of calls made.
+    """
+    calls = []
+
+    def func():
+        calls.append(None)
+        if len(calls) <= failures:
+            raise error('down')
+        return len(calls)
+    return func, calls
+
+
+def test_retryable_failures_are_retried():
+    func, calls = flaky(2)
+    failed = []
+    assert resilience.call(func, times=5, on_failure=lambda: failed.append(None)) == 3
+    assert len(failed) == 2
+
+
+def test_other_failures_are_raised_at_once():
+    func, calls = flaky(1, KeyError)
+    with pytest.raises(KeyError):
+        resilience.call(func, times=5)
+    assert len(calls) == 1
+
+
+def test_last_failure_is_raised_after_every_attempt():
+    func, calls = flaky(5)
+    with pytest.raises(URLError):
+        resilience.call(func, times=3)
+    assert len(calls) == 3
+
+
+def test_breaker_opens_after_consecutive_failures():
+    func, calls = flaky(10)
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.call(func, times=5, host='example.com')
+    assert len(calls) == 3
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.call(func, times=5, host='example.com')
+    assert len(calls) == 3
+    assert resilience.call(flaky(0)[0], host='other.example.com') == 1
+
+
+def test_breaker_trial_call_closes_it_after_cooldown():
+    func, calls = flaky(3)
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.call(func, times=5, host='example.com')
+    circuit = resilience.breaker('example.com')
+    circuit.opened -= circuit.cooldown
+    assert resilience.call(func, times=1, host='example.com') == 4
+    assert (circuit.failures, circuit.opened) == (0, None)
+
+
+def test_failed_trial_call_reopens_the_breaker():
+    func, calls = flaky(10)
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.call(func, times=5, host='example.com')
+    circuit = resilience.breaker('example.com')
+    circuit.opened -= circuit.cooldown
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.call(func, times=5, host='example.com')
+    assert len(calls) == 4
+
+
+def test_is_retryable():
+    APIResponseException = type('APIResponseException', (Exception,), {'__module__': 'tableauscraper.api'})
+    assert resilience.is_retryable(resilience.EmptyResponse())
+    assert resilience.is_retryable(TimeoutError())
+    assert resilience.is_retryable(type('Throttled', (APIResponseException,), {})())
+    assert not resilience.is_retryable(resilience.CircuitOpen())
+    assert not resilience.is_retryable(KeyError('Category'))
+
+
+def test_retry_clears_the_checkpoint_once_the_source_finishes():
+    @resilience.retry(times=3)
+    def source():
+        written = resilience.checkpoint('source')
+        if not written:
+            written['cases'] = True
+            raise URLError('down')
+        return dict(written)
+
+    assert source() == {'cases': True}
+    assert resilience.checkpoint('source') == {}
+
+
+def test_backoff_is_capped():
+    assert all(0 <= backoff(attempt) <= min(60, 2 * 2 ** attempt) for attempt in range(10) for _ in range(20))
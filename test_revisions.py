@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+import revisions
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'timeseries.sqlite')
+
+
+def vintage(**columns):
+    return pd.DataFrame({'County': ['Acadia', 'Allen'], **columns})
+
+
+def test_only_changed_cells_are_recorded(db):
+    assert revisions.record('cases', vintage(**{'3/9/2020': [1, 2]}), '2020-03-10', db) == 2
+    assert revisions.record('cases', vintage(**{'3/9/2020': [1, 3], '3/10/2020': [4, 5]}), '2020-03-11', db) == 3
+    assert revisions.record('cases', vintage(**{'3/9/2020': [1, 3], '3/10/2020': [4, 5]}), '2020-03-12', db) == 0
+
+
+def test_as_of(db):
+    revisions.record('cases', vintage(**{'3/9/2020': [1, 2]}), '2020-03-10', db)
+    revisions.record('cases', vintage(**{'3/9/2020': [1, 3]}), '2020-03-11', db)
+    before = revisions.as_of('cases', '2020-03-10', db).set_index('series')['value']
+    after = revisions.as_of('cases', '2020-03-12', db).set_index('series')['value']
+    assert before.to_dict() == {'Acadia': 1.0, 'Allen': 2.0}
+    assert after.to_dict() == {'Acadia': 1.0, 'Allen': 3.0}
+
+
+def test_dropped_cells_disappear_from_later_vintages(db):
+    revisions.record('cases', vintage(**{'3/9/2020': [1, 2]}), '2020-03-10', db)
+    revisions.record('cases', vintage(**{'3/9/2020': [1, None]}), '2020-03-11', db)
+    assert list(revisions.as_of('cases', '2020-03-11', db)['series']) == ['Acadia']
+
+
+def test_history(db):
+    revisions.record('cases', vintage(**{'3/9/2020': [1, 2]}), '2020-03-10', db)
+    revisions.record('cases', vintage(**{'3/9/2020': [1, 3]}), '2020-03-11', db)
+    history = revisions.history('cases', '3/9/2020', 'Allen', db)
+    assert history[['report_date', 'value']].values.tolist() == [['2020-03-10', 2.0], ['2020-03-11', 3.0]]
+
+
+def test_recording_a_date_again_replaces_it(db):
+    revisions.record('cases', vintage(**{'3/9/2020': [1, 2]}), '2020-03-10', db)
+    revisions.record('cases', vintage(**{'3/9/2020': [1, 5]}), '2020-03-10', db)
+    assert revisions.history('cases', '3/9/2020', 'Allen', db)['value'].tolist() == [5.0]
+
+
+def test_long_joins_identifier_columns():
+    df = pd.DataFrame({'Geography': ['Louisiana'], 'Category': ['Age'], '3/9/2020': [1]})
+    assert revisions._long(df).values.tolist() == [['Louisiana - Age', '2020-03-09', 1]]
+
+
+def test_backfill_from_git_matches_the_committed_file(db):
+    revisions.backfill_from_git('cases', 'data/cases.csv', db)
+    committed = revisions._long(pd.read_csv(f'{revisions.module_path}/data/cases.csv')).dropna()
+    latest = revisions.as_of('cases', '9999-12-31', db)
+    key = ['series', 'ref_date']
+    assert latest.sort_values(key)[key + ['value']].values.tolist() == committed.sort_values(key).values.tolist()
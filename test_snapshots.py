@@ -0,0 +1,91 @@
+import json
+import pytest
+import snapshots
+
+
+def csv(*rows):
+    return ''.join(f'{i},{r}\n' for i, r in enumerate(rows)).encode()
+
+
+def test_materialize_returns_latest_on_or_before(tmp_path):
+    root = str(tmp_path)
+    first, second = csv('a,1', 'b,2'), csv('a,1', 'b,3')
+    snapshots.add('layer', '2021-01-01', first, root)
+    snapshots.add('layer', '2021-01-03', second, root)
+    assert snapshots.materialize('layer', '2021-01-01', root) == first
+    assert snapshots.materialize('layer', '2021-01-02', root) == first
+    assert snapshots.materialize('layer', '2021-01-05', root) == second
+    assert snapshots.dates('layer', root) == ['2021-01-01', '2021-01-03']
+
+
+def test_materialize_before_first_snapshot(tmp_path):
+    snapshots.add('layer', '2021-01-02', csv('a,1'), str(tmp_path))
+    with pytest.raises(KeyError):
+        snapshots.materialize('layer', '2021-01-01', str(tmp_path))
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    root = str(tmp_path)
+    data = csv('a,1', 'b,2')
+    snapshots.add('layer', '2021-01-01', data, root)
+    snapshots.add('layer', '2021-01-02', data, root)
+    index = snapshots.load_index('layer', root)
+    assert len(index['objects']) == 1
+    assert index['hashes'][0] == index['hashes'][1]
+
+
+def test_small_changes_are_stored_as_deltas(tmp_path):
+    root = str(tmp_path)
+    rows = [f'row{i},{i}' for i in range(20)]
+    snapshots.add('layer', '2021-01-01', csv(*rows), root)
+    rows[5] = 'row5,changed'
+    rows.append('row20,20')
+    changed = csv(*rows)
+    digest = snapshots.add('layer', '2021-01-02', changed, root)
+    assert snapshots.load_index('layer', root)['objects'][digest]['depth'] == 1
+    assert snapshots.materialize('layer', '2021-01-02', root) == changed
+
+
+def test_shorter_snapshot_round_trips(tmp_path):
+    root = str(tmp_path)
+    rows = [f'row{i},{i}' for i in range(20)]
+    snapshots.add('layer', '2021-01-01', csv(*rows), root)
+    shorter = csv(*rows[:18])
+    snapshots.add('layer', '2021-01-02', shorter, root)
+    assert snapshots.materialize('layer', '2021-01-02', root) == shorter
+
+
+def test_import_directory_removes_verified_files(tmp_path):
+    directory, root = tmp_path / 'full', tmp_path / 'store'
+    directory.mkdir()
+    (directory / 'Layer_A2021-01-01.csv').write_bytes(b',name,value\n' + csv('a,1'))
+    (directory / 'Layer_A2021-01-02.csv').write_bytes(b',name,value\n' + csv('a,2'))
+    (directory / 'notes.txt').write_text('kept')
+    snapshots.import_directory(str(directory), str(root), remove=True)
+    assert sorted(p.name for p in directory.iterdir()) == ['notes.txt']
+    assert snapshots.datasets(str(root)) == ['Layer_A']
+    assert snapshots.read('Layer_A', '2021-01-02', str(root)).iloc[0].tolist() == ['a', 2]
+    assert json.loads((root / 'index' / 'Layer_A.json').read_text())['dates'] == ['2021-01-01', '2021-01-02']
+
+
+def test_delta_chains_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, 'max_chain', 2)
+    root = str(tmp_path)
+    rows = [f'row{i},{i}' for i in range(20)]
+    contents, depths = [], []
+    for day in range(1, 5):
+        rows[0] = f'row0,{day}'
+        contents.append(csv(*rows))
+        digest = snapshots.add('layer', f'2021-01-0{day}', contents[-1], root)
+        depths.append(snapshots.load_index('layer', root)['objects'][digest]['depth'])
+    assert depths == [0, 1, 2, 0]
+    assert [snapshots.materialize('layer', f'2021-01-0{day}', root) for day in range(1, 5)] == contents
+
+
+def test_rewritten_snapshot_is_stored_whole(tmp_path):
+    root = str(tmp_path)
+    snapshots.add('layer', '2021-01-01', csv(*[f'row{i},{i}' for i in range(20)]), root)
+    rewritten = csv(*[f'row{i},x' for i in range(20)])
+    digest = snapshots.add('layer', '2021-01-02', rewritten, root)
+    assert snapshots.load_index('layer', root)['objects'][digest] == {'base': None, 'depth': 0}
+    assert snapshots.materialize('layer', '2021-01-02', root) == rewritten
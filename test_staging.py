@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+import pandas as pd
+import pytest
+import staging
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / '.commits')
+
+
+def test_batch_commits_every_file_together(tmp_path, journal):
+    a, b = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    with staging.batch(journal) as batch:
+        batch.write(str(a), 'a')
+        batch.write(str(b), 'b')
+        assert not a.exists() and not b.exists()
+    assert a.read_text() == 'a' and b.read_text() == 'b'
+    assert os.listdir(journal) == []
+
+
+def test_failed_batch_leaves_files_untouched(tmp_path, journal):
+    a = tmp_path / 'a.csv'
+    a.write_text('old')
+    with pytest.raises(RuntimeError):
+        with staging.batch(journal) as batch:
+            batch.write(str(a), 'new')
+            raise RuntimeError
+    assert a.read_text() == 'old'
+    assert [p.name for p in tmp_path.iterdir()] == ['a.csv']
+
+
+def test_unchanged_content_is_not_rewritten(tmp_path, journal):
+    a = tmp_path / 'a.csv'
+    df = pd.DataFrame({'x': [1, 2]})
+    df.to_csv(a, index=False)
+    before = os.stat(a).st_mtime_ns
+    with staging.batch(journal) as batch:
+        assert staging.write_csv(df, str(a), index=False) is False
+    assert batch.skipped == [str(a)]
+    assert os.stat(a).st_mtime_ns == before
+
+
+def test_nested_batches_join_the_outer_one(tmp_path, journal):
+    a = tmp_path / 'a.csv'
+    with staging.batch(journal) as outer:
+        with staging.batch(journal) as inner:
+            inner.write(str(a), 'a')
+        assert inner is outer
+        assert not a.exists()
+    assert a.read_text() == 'a'
+
+
+def test_recover_rolls_forward_an_abandoned_journal(tmp_path, journal):
+    a, tmp = tmp_path / 'a.csv', tmp_path / '.a.csv.1.tmp'
+    a.write_text('old')
+    tmp.write_text('new')
+    os.makedirs(journal)
+    with open(f'{journal}/crashed.json', 'w') as f:
+        json.dump({'files': [[str(tmp), str(a)]]}, f)
+    staging.recover(journal)
+    assert a.read_text() == 'new'
+    assert os.listdir(journal) == []
+
+
+def test_recover_skips_a_journal_another_process_holds(tmp_path, journal):
+    a, tmp = tmp_path / 'a.csv', tmp_path / '.a.csv.1.tmp'
+    a.write_text('old')
+    tmp.write_text('new')
+    os.makedirs(journal)
+    holder = subprocess.Popen(
+        [sys.executable, '-c',
+         'import json, sys, staging\n'
+         f'f = open({journal!r} + "/live.json", "x")\n'
+         'staging._lock(f)\n'
+         f'json.dump({{"files": [[{str(tmp)!r}, {str(a)!r}]]}}, f)\n'
+         'f.flush()\n'
+         'print("locked", flush=True)\n'
+         'sys.stdin.read()\n'],
+        cwd=os.path.dirname(staging.__file__), stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == 'locked'
+        staging.recover(journal)
+        assert a.read_text() == 'old'
+    finally:
+        holder.communicate('')
+    staging.recover(journal)
+    assert a.read_text() == 'new'
+
+
+def test_recover_waits_before_removing_an_empty_journal(journal):
+    os.makedirs(journal)
+    empty = f'{journal}/starting.json'
+    open(empty, 'w').close()
+    staging.recover(journal)
+    assert os.path.exists(empty)
+    os.utime(empty, (0, 0))
+    staging.recover(journal)
+    assert os.listdir(journal) == []
+
+
+def test_restaging_a_file_keeps_the_last_write_and_its_mode(tmp_path, journal):
+    a = tmp_path / 'a.csv'
+    a.write_text('old')
+    a.chmod(0o600)
+    with staging.batch(journal) as batch:
+        batch.write(str(a), 'first')
+        batch.write(str(a), 'second')
+    assert a.read_text() == 'second'
+    assert a.stat().st_mode & 0o777 == 0o600
+    assert [p.name for p in tmp_path.iterdir() if p.name != '.commits'] == ['a.csv']
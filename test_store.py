@@ -0,0 +1,103 @@
+import pandas as pd
+import pytest
+import store
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'timeseries.sqlite')
+
+
+@pytest.fixture
+def wide_csv(tmp_path):
+    file = tmp_path / 'cases.csv'
+    file.write_text('FIPS,County,3/9/2020,3/10/2020\n'
+                    '22001,Acadia,0,1\n'
+                    '22003,Allen,,2\n')
+    return str(file)
+
+
+def test_iso_date():
+    assert store.iso_date('3/9/2020') == '2020-03-09'
+    assert store.iso_date('03/24/2020') == '2020-03-24'
+    assert store.iso_date('2020-03-04 00:00:00') == '2020-03-04'
+    assert store.iso_date('County') is None
+
+
+def test_split_columns():
+    df = pd.DataFrame(columns=['FIPS', 'County', '3/9/2020', '3/10/2020'])
+    assert store.split_columns(df) == (['FIPS', 'County'], ['3/9/2020', '3/10/2020'])
+
+
+def test_import_and_export_round_trip(db, wide_csv, tmp_path):
+    store.import_wide('cases', wide_csv, 'County', db)
+    out = tmp_path / 'out.csv'
+    store.export('cases', str(out), db)
+    assert out.read_text() == open(wide_csv).read()
+
+
+def test_real_table_round_trips(db, tmp_path):
+    # cases.csv has blank cells in integer columns, e.g. its latest day.
+    file = f'{store.module_path}/data/cases.csv'
+    store.import_wide('cases', file, 'County', db)
+    out = tmp_path / 'out.csv'
+    store.export('cases', str(out), db)
+    assert out.read_text() == open(file).read()
+
+
+def test_float_columns_stay_float(db, tmp_path):
+    file = tmp_path / 'cases.csv'
+    file.write_text('County,3/9/2020,3/10/2020\nAcadia,0.0,1.0\nAllen,,2.0\n')
+    store.import_wide('cases', str(file), 'County', db)
+    assert store.wide('cases', db).to_csv(index=False) == file.read_text()
+
+
+def test_new_days_with_gaps_are_written_as_integers(db, wide_csv, tmp_path):
+    store.ensure('cases', wide_csv, 'County', db)
+    store.append('cases', pd.DataFrame({'County': ['Acadia'], '3/11/2020': [12611.0]}), 'County', '3/11/2020', db)
+    out = tmp_path / 'out.csv'
+    store.export('cases', str(out), db)
+    assert out.read_text().splitlines()[1:] == ['22001,Acadia,0,1,12611', '22003,Allen,,2,']
+
+
+def test_store_without_integral_flags_is_upgraded(db, wide_csv):
+    conn = store.sqlite3.connect(db)
+    conn.executescript(store.schema.replace('    integral INTEGER,\n', ''))
+    conn.close()
+    store.import_wide('cases', wide_csv, 'County', db)
+    assert store.wide('cases', db)['3/9/2020'].tolist()[0] == 0
+
+
+def test_append_replaces_the_day(db, wide_csv):
+    store.ensure('cases', wide_csv, 'County', db)
+    store.append('cases', pd.DataFrame({'County': ['Acadia', 'Allen'], '3/11/2020': [5, 6]}), 'County', '3/11/2020', db)
+    store.append('cases', pd.DataFrame({'County': ['Acadia'], '3/11/2020': [7]}), 'County', '3/11/2020', db)
+    df = store.wide('cases', db).set_index('County')
+    assert df.loc['Acadia', '3/11/2020'] == 7
+    assert pd.isnull(df.loc['Allen', '3/11/2020'])
+
+
+def test_append_adds_new_series(db, wide_csv):
+    store.ensure('cases', wide_csv, 'County', db)
+    store.append('cases', pd.DataFrame({'County': ['Winn'], '3/11/2020': [3]}), 'County', '3/11/2020', db)
+    df = store.wide('cases', db)
+    assert list(df['County']) == ['Acadia', 'Allen', 'Winn']
+    assert pd.isnull(df['FIPS'].iloc[-1])
+
+
+def test_append_days_missing_only_fills_gaps(db, wide_csv):
+    store.ensure('cases', wide_csv, 'County', db)
+    days = pd.DataFrame({'County': ['Acadia', 'Allen'], '3/9/2020': [9, 9], '3/10/2020': [9, 9]})
+    store.append_days('cases', days, 'County', ['3/9/2020', '3/10/2020'], db, replace='missing')
+    df = store.wide('cases', db).set_index('County')
+    assert df.loc['Acadia', '3/9/2020'] == 0
+    assert df.loc['Allen', '3/9/2020'] == 9
+    assert df.loc['Allen', '3/10/2020'] == 2
+
+
+def test_load_filters(db, wide_csv):
+    store.import_wide('cases', wide_csv, 'County', db)
+    df = store.load('cases', geography='Acadia', start='3/10/2020', path=db)
+    assert df[['geography', 'value']].values.tolist() == [['Acadia', 1.0]]
+    assert store.modified('cases', db) is not None
+    assert store.modified('deaths', db) is None
@@ -0,0 +1,100 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import json
+import numpy as np
+import pandas as pd
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+tracts_csv = f'{module_path}/data/cases_tests_tracts.csv'
+tracts_path = f'{module_path}/data/tracts'
+
+# Stored in place of a blank count; int32 has no NaN.
+missing = -1
+
+
+def convert(csv=None, directory=None):
+    """
+    Converts the wide tract CSV into a compact on-disk layout:
+    tracts.npy (int64 tract id per row), codes.npy (int8 Category code per
+    row), counts.npy (contiguous int32 rows x weeks matrix) and meta.json
+    (Category names and ISO week dates). counts.npy can be memory-mapped, so
+    a tract or a week is read without parsing or loading the whole table.
+    """
+    csv = csv or tracts_csv
+    directory = directory or tracts_path
+    df = pd.read_csv(csv, dtype={'Tract': 'int64', 'Category': 'category'})
+    week_columns = [c for c in df.columns if c not in ('Tract', 'Category')]
+    counts = df[week_columns].fillna(missing).to_numpy(dtype=np.int32)
+    os.makedirs(directory, exist_ok=True)
+    np.save(f'{directory}/tracts.npy', df['Tract'].to_numpy(dtype=np.int64))
+    np.save(f'{directory}/codes.npy', df['Category'].cat.codes.to_numpy(dtype=np.int8))
+    meta = {'categories': list(df['Category'].cat.categories),
+            'weeks': [pd.Timestamp(c).strftime('%Y-%m-%d') for c in week_columns]}
+    with open(f'{directory}/meta.json', 'w') as f:
+        json.dump(meta, f)
+    # counts.npy is written last; load() treats it as the marker of a
+    # complete conversion.
+    np.save(f'{directory}/counts.npy', np.ascontiguousarray(counts))
+    logger.info(f'Converted {len(df)} tract rows x {len(week_columns)} weeks to {directory}.')
+
+
+class TractTable:
+    """
+    Typed view of the tract table. ``counts`` is a memory map unless
+    ``mmap`` is False, so slicing touches only the rows or column asked for.
+    """
+    def __init__(self, directory=None, mmap=True):
+        directory = directory or tracts_path
+        self.tracts = np.load(f'{directory}/tracts.npy')
+        self.codes = np.load(f'{directory}/codes.npy')
+        self.counts = np.load(f'{directory}/counts.npy', mmap_mode='r' if mmap else None)
+        with open(f'{directory}/meta.json') as f:
+            meta = json.load(f)
+        self.categories = meta['categories']
+        self.weeks = pd.DatetimeIndex(meta['weeks'])
+
+    def _frame(self, rows, columns=slice(None)):
+        counts = np.asarray(self.counts[rows][:, columns])
+        df = pd.DataFrame(counts, columns=self.weeks[columns])
+        df.insert(0, 'Category', pd.Categorical.from_codes(self.codes[rows], self.categories))
+        df.insert(0, 'Tract', self.tracts[rows])
+        return df
+
+    def tract(self, tract):
+        """
+        All weekly counts for one tract id, one row per Category.
+        """
+        return self._frame(np.flatnonzero(self.tracts == int(tract)))
+
+    def week(self, date):
+        """
+        Counts for one week across every tract and Category.
+        """
+        position = self.weeks.get_loc(pd.Timestamp(date))
+        df = self._frame(slice(None), slice(position, position + 1))
+        return df.rename(columns={self.weeks[position]: 'Count'})
+
+    def to_frame(self):
+        return self._frame(slice(None))
+
+
+def load(directory=None, csv=None, mmap=True):
+    """
+    Returns the TractTable, converting the CSV first if the compact copy is
+    missing or older than the CSV.
+    """
+    directory = directory or tracts_path
+    csv = csv or tracts_csv
+    marker = f'{directory}/counts.npy'
+    if not os.path.exists(marker) or (os.path.exists(csv) and os.path.getmtime(csv) > os.path.getmtime(marker)):
+        convert(csv, directory)
+    return TractTable(directory, mmap)
@@ -0,0 +1,78 @@
+#!env/bin/python
+import os
+import sys
+
+module_path = os.path.abspath(os.path.dirname(__file__))
+if module_path not in sys.path:
+    sys.path.append(module_path)
+import threading
+import time
+from collections import defaultdict
+from tableauscraper import TableauScraper as TS
+import metrics
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Seconds a bootstrapped dashboard session is reused before being reloaded.
+ttl = int(os.environ.get('COVID_LA_WORKBOOK_TTL', 900))
+
+_cache = {}
+_cache_guard = threading.Lock()
+_url_locks = defaultdict(threading.Lock)
+_requested = threading.local()
+
+
+def scraper(url, max_age=None):
+    """
+    Returns a loaded TableauScraper for a view URL, bootstrapping the view at
+    most once per time-to-live no matter how many sources ask for it. Callers
+    that only read worksheets share the session; filter sweeps should use
+    their own sessions so they do not change what other sources see.
+    :param url: The Tableau view URL
+    :param max_age: Override of the module ttl, in seconds
+    """
+    max_age = ttl if max_age is None else max_age
+    _requested.__dict__.setdefault('urls', set()).add(url)
+    with _cache_guard:
+        lock = _url_locks[url]
+    # Per-URL lock so concurrent sources wait for one bootstrap instead of
+    # each starting their own.
+    with lock:
+        cached = _cache.get(url)
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+        ts = TS()
+        with metrics.stage('tableau_load', url):
+            ts.loads(url)
+        _cache[url] = (time.monotonic(), ts)
+        logger.info(f'Loaded Tableau view {url}')
+        return ts
+
+
+def workbook(url, max_age=None):
+    return scraper(url, max_age).getWorkbook()
+
+
+def invalidate(url=None):
+    """
+    Drops the cached session for ``url``, or every cached session if no URL
+    is given, so the next request bootstraps the view again.
+    """
+    with _cache_guard:
+        if url is None:
+            _cache.clear()
+        else:
+            _cache.pop(url, None)
+
+
+def invalidate_requested():
+    """
+    Drops the sessions the calling thread has asked for. Used after a failed
+    source so its retry starts from fresh sessions without discarding the
+    sessions other sources are using.
+    """
+    for url in _requested.__dict__.pop('urls', set()):
+        invalidate(url)